@@ -0,0 +1,164 @@
+"""
+保管庫のオンラインバックアップ（SQLite のバックアップ API）。
+  - BACKUP_PAGES_PER_STEP ページずつ写すので、アプリが書き込んでいても長く待たせない
+  - 写すのは別スレッド・別接続（BackupScheduler）。UI のスレッドは止まらない
+  - meta.change_seq（書き込みトランザクションごとに進む）が前回のスナップショットから動いたときだけ取る
+  - BACKUP_DIR に最大 BACKUP_KEEP 世代。古いものから消す
+  - verify=True なら整合性チェックをして SHA-256 を <ファイル名>.sha256 に記録する（verify_snapshot で確かめられる）
+"""
+import os, re, sqlite3, hashlib, threading
+from datetime import datetime
+from config import BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES_PER_STEP, BACKUP_VERIFY
+from processor import get_db
+
+# ファイル名: <DB名>-<日時>-<change_seq>.db（名前順 = 古い順）
+_NAME_RE = re.compile(r"^(?P<stem>.+)-(?P<ts>\d{8}-\d{6})-(?P<seq>\d+)\.db$")
+
+class BackupCancelled(Exception):
+    pass
+
+def _stem(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+def list_snapshots(db_path: str | None = None, dest_dir: str = BACKUP_DIR) -> list[tuple[str, int]]:
+    """(パス, change_seq) を古い順に。"""
+    stem = _stem(db_path or get_db().path)
+    if not os.path.isdir(dest_dir):
+        return []
+    out = []
+    for name in sorted(os.listdir(dest_dir)):
+        m = _NAME_RE.match(name)
+        if m and m["stem"] == stem:
+            out.append((os.path.join(dest_dir, name), int(m["seq"])))
+    return out
+
+def _change_seq(conn) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key='change_seq';").fetchone()
+    return int(row[0]) if row else 0
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _check_integrity(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA integrity_check;").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise sqlite3.DatabaseError(f"バックアップの整合性チェックに失敗しました: {result}")
+
+def verify_snapshot(path: str) -> bool:
+    """記録した SHA-256 と一致し、整合性チェックも通るか（.sha256 が無ければ整合性チェックだけ）。"""
+    try:
+        with open(path + ".sha256", "r", encoding="utf-8") as fh:
+            if fh.read().split()[0] != _sha256(path):
+                return False
+    except FileNotFoundError:
+        pass
+    try:
+        _check_integrity(path)
+    except sqlite3.DatabaseError:
+        return False
+    return True
+
+def _rotate(db_path: str, dest_dir: str, keep: int):
+    snaps = list_snapshots(db_path, dest_dir)
+    for path, _ in snaps[:max(len(snaps) - keep, 0)]:
+        for p in (path, path + ".sha256"):
+            if os.path.exists(p):
+                os.remove(p)
+
+def take_snapshot(db_path: str | None = None, dest_dir: str = BACKUP_DIR, *, keep: int = BACKUP_KEEP,
+                  verify: bool = BACKUP_VERIFY, pages: int = BACKUP_PAGES_PER_STEP, force: bool = False,
+                  progress=None, cancel: threading.Event | None = None) -> str | None:
+    """
+    db_path（省略時はアプリの DB）のスナップショットを dest_dir に取り、パスを返す。
+    前回から変更が無ければ何もせず None（force=True なら取る）。
+    自前の接続で読むので、どのスレッドから呼んでもよい。progress(残りページ, 全ページ) をステップごとに呼ぶ。
+    cancel がセットされると BackupCancelled（書きかけは消す）。
+    """
+    db_path = db_path or get_db().path
+    tmp = os.path.join(dest_dir, f".{_stem(db_path)}.tmp")
+    def _step(status, remaining, total):
+        if cancel is not None and cancel.is_set():
+            raise BackupCancelled()
+        if progress:
+            progress(remaining, total)
+    src = sqlite3.connect(db_path, timeout=5)
+    try:
+        snaps = list_snapshots(db_path, dest_dir)
+        if not force and snaps and snaps[-1][1] == _change_seq(src):
+            return None
+        os.makedirs(dest_dir, exist_ok=True)
+        # 読み取りトランザクションを開いたまま写す。WAL なのでその時点のスナップショットが読め、
+        # 途中でアプリが書き込んでも最初からやり直しにならない（書き込み側も待たされない）
+        src.execute("BEGIN;")
+        seq = _change_seq(src)
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst, pages=pages, progress=_step, sleep=0.005)
+            dst.execute("PRAGMA journal_mode=DELETE;")  # 単体の1ファイルとして置く（-wal / -shm を作らない）
+        finally:
+            dst.close()
+        if verify:
+            _check_integrity(tmp)
+        path = os.path.join(dest_dir, f"{_stem(db_path)}-{datetime.now():%Y%m%d-%H%M%S}-{seq}.db")
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        src.close()
+    if verify:
+        with open(path + ".sha256", "w", encoding="utf-8") as fh:
+            fh.write(f"{_sha256(path)}  {os.path.basename(path)}\n")
+    _rotate(db_path, dest_dir, keep)
+    return path
+
+class BackupScheduler:
+    """
+    take_snapshot を別スレッドで走らせる（1度に1つ）。GUI のタイマーから start() を呼ぶ想定。
+    終わったら result で (パス or None, 例外 or None) が読める。
+    """
+    def __init__(self, db_path: str | None = None, dest_dir: str = BACKUP_DIR, **options):
+        self.db_path = db_path or get_db().path
+        self.dest_dir = dest_dir
+        self.options = options
+        self.result = None
+        self._thread: threading.Thread | None = None
+        self._cancel = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, *, force: bool = False) -> bool:
+        """走っていなければ始める。始めたら True。"""
+        if self.running:
+            return False
+        self._cancel.clear()
+        self.result = None
+        self._thread = threading.Thread(target=self._run, args=(force,), name="backup", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, force: bool):
+        try:
+            path = take_snapshot(self.db_path, self.dest_dir, force=force, cancel=self._cancel, **self.options)
+            self.result = (path, None)
+        except BackupCancelled:
+            self.result = (None, None)
+        except Exception as e:
+            self.result = (None, e)
+
+    def stop(self, timeout: float | None = None):
+        """走っていれば止めて待つ（終了時用）。"""
+        if self.running:
+            self._cancel.set()
+            self._thread.join(timeout)
@@ -0,0 +1,63 @@
+"""
+一括書き込みのベンチ（旧：1件ずつ add/update/delete vs 新：*_bulk で1トランザクション）
+  python benchmarks/bench_bulk.py [件数]
+"""
+import os, sys, time, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import (
+    create_vault_key, open_db, close_db, init_db, ensure_group_column, migrate_tags_to_table,
+    add_bookmark_to_db, update_bookmark_tags, delete_bookmark_by_id, get_bookmarks_by_ids,
+    add_bookmarks_bulk, update_tags_bulk, delete_bookmarks_bulk
+)
+
+def _timed(label, fn):
+    t0 = time.perf_counter(); fn(); dt = time.perf_counter() - t0
+    print(f"  {label:<12} {dt*1000:9.1f} ms")
+    return dt
+
+def _items(n, tag):
+    return [(f"example{i % 97}.com", f"title {i}", f"https://example{i % 97}.com/{tag}/{i}", "a, b",
+             f"example{i % 97}.com") for i in range(n)]
+
+def _open(path, f=None):
+    open_db(path); init_db(); ensure_group_column()
+    f = f or create_vault_key("bench-password")
+    migrate_tags_to_table(f)
+    return f
+
+def run_single(path, n):
+    f = _open(path)
+    print("[single: one call per row]")
+    ids = []
+    total = _timed("add", lambda: ids.extend(add_bookmark_to_db(*it, f) for it in _items(n, "s")))
+    shown = get_bookmarks_by_ids(ids, f)  # 画面に出ている行（＝キャッシュ済み）を編集する想定
+    def _edit():
+        # 旧 _bulk_edit_tags と同じ：現在のタグに足して1件ずつ書き戻す
+        for bm in shown:
+            update_bookmark_tags(bm.id, bm.tags_str + ", c", f)
+    total += _timed("edit_tags", _edit)
+    total += _timed("delete", lambda: [delete_bookmark_by_id(i) for i in ids])
+    print(f"  {'total':<12} {total*1000:9.1f} ms")
+    close_db()
+
+def run_bulk(path, n):
+    f = _open(path)
+    print("[bulk: one transaction per call]")
+    ids = []
+    total = _timed("add", lambda: ids.extend(bm.id for bm in add_bookmarks_bulk(_items(n, "b"), f)))
+    get_bookmarks_by_ids(ids, f)
+    total += _timed("edit_tags", lambda: update_tags_bulk(ids, "add", ["c"], f))
+    total += _timed("delete", lambda: delete_bookmarks_bulk(ids))
+    print(f"  {'total':<12} {total*1000:9.1f} ms")
+    close_db()
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as d:
+        print(f"n={n}")
+        run_single(os.path.join(d, "single.db"), n)
+        run_bulk(os.path.join(d, "bulk.db"), n)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+DB接続レイヤのベンチ（旧：呼び出し毎に connect/commit vs 新：長寿命接続）
+  python benchmarks/bench_db.py [件数]
+"""
+import os, sys, time, sqlite3, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import (
+    create_vault_key, open_db, close_db, init_db, ensure_group_column, compute_url_hash,
+    add_bookmark_to_db, update_bookmark_tags, find_bookmark_by_urlhash,
+    delete_bookmark_by_id
+)
+
+# ---- 旧実装（ベースライン）: 毎回 connect → 1文 → commit
+def legacy_add(path, domain, title, url, tags, group, f):
+    h = compute_url_hash(url)
+    with sqlite3.connect(path) as conn:
+        conn.execute("""INSERT INTO bookmarks (enc_domain, enc_title, enc_url, enc_tags, enc_group, url_hash)
+                        VALUES (?, ?, ?, ?, ?, ?);""",
+                     (f.encrypt(domain.encode()), f.encrypt(title.encode()), f.encrypt(url.encode()),
+                      f.encrypt(tags.encode()), f.encrypt(group.encode()), h))
+        conn.commit()
+
+def legacy_update_tags(path, bm_id, tags, f):
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE bookmarks SET enc_tags=? WHERE id=?", (f.encrypt(tags.encode()), bm_id))
+        conn.commit()
+
+def legacy_find(path, h):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT id FROM bookmarks WHERE url_hash=? LIMIT 1;", (h,)).fetchone()
+
+def legacy_delete(path, bm_id):
+    with sqlite3.connect(path) as conn:
+        conn.execute("DELETE FROM bookmarks WHERE id=?", (bm_id,))
+        conn.commit()
+
+def _timed(label, fn):
+    t0 = time.perf_counter(); fn(); dt = time.perf_counter() - t0
+    print(f"  {label:<12} {dt*1000:9.1f} ms")
+    return dt
+
+def _urls(n):
+    return [f"https://example{i % 97}.com/path/{i}?q={i}" for i in range(n)]
+
+def run_legacy(path, n, f):
+    urls = _urls(n)
+    print("[legacy: connect per call]")
+    total = 0.0
+    total += _timed("add", lambda: [legacy_add(path, "example.com", f"title {i}", u, "a, b", "example.com", f) for i, u in enumerate(urls)])
+    total += _timed("update_tags", lambda: [legacy_update_tags(path, i + 1, "a, b, c", f) for i in range(n)])
+    total += _timed("find", lambda: [legacy_find(path, compute_url_hash(u)) for u in urls])
+    total += _timed("delete", lambda: [legacy_delete(path, i + 1) for i in range(n)])
+    print(f"  {'total':<12} {total*1000:9.1f} ms")
+
+def run_pooled(path, n, f):
+    urls = _urls(n)
+    open_db(path); init_db(); ensure_group_column()
+    print("[pooled: long-lived connection + WAL]")
+    total = 0.0
+    total += _timed("add", lambda: [add_bookmark_to_db("example.com", f"title {i}", u, "a, b", "example.com", f) for i, u in enumerate(urls)])
+    total += _timed("update_tags", lambda: [update_bookmark_tags(i + 1, "a, b, c", f) for i in range(n)])
+    total += _timed("find", lambda: [find_bookmark_by_urlhash(compute_url_hash(u), f) for u in urls])
+    total += _timed("delete", lambda: [delete_bookmark_by_id(i + 1) for i in range(n)])
+    print(f"  {'total':<12} {total*1000:9.1f} ms")
+    close_db()
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as d:
+        legacy_path = os.path.join(d, "legacy.db")
+        open_db(legacy_path); init_db(); ensure_group_column()
+        f = create_vault_key("bench-password")
+        close_db()
+        # 旧実装はデフォルトの rollback journal で計測する
+        with sqlite3.connect(legacy_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE;")
+        print(f"n={n}")
+        run_legacy(legacy_path, n, f)
+        run_pooled(os.path.join(d, "pooled.db"), n, f)
+
+if __name__ == "__main__":
+    main()
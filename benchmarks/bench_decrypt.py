@@ -0,0 +1,58 @@
+"""
+一括復号の並列度ベンチ（その場で復号 vs スレッド vs プロセスプール）
+プロセスは「初回（プールを起こす分込み）」と「2回目以降（使い回したプール）」を分けて測る。
+Windows（exe 版）と同じ条件にするときは --spawn を付ける。
+  python benchmarks/bench_decrypt.py [件数] [--spawn]
+"""
+import os, sys, time, multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from config import DECRYPT_CHUNK_SIZE
+from processor import _encrypt_record, _decrypt_chunk, _chunks, _open_pool
+
+REPS = 3
+
+def _rows(f, n):
+    # _ROW_COLS と同じ並び（現行形式のレコード1つ）
+    return [(i + 1, _encrypt_record(f, f"example{i % 97}.com", f"title {i}", f"https://example{i % 97}.com/path/{i}",
+                                    f"example{i % 97}.com"), f"{i:064x}", "", "", "", None, None)
+            for i in range(n)]
+
+def _run(pool, rows, f):
+    task = partial(_decrypt_chunk, f=f) if isinstance(pool, ThreadPoolExecutor) else _decrypt_chunk
+    return [v for part in pool.map(task, _chunks(rows, DECRYPT_CHUNK_SIZE)) for v in part]
+
+def _ms(fn):
+    t0 = time.perf_counter(); fn(); return (time.perf_counter() - t0) * 1000
+
+def main():
+    args = sys.argv[1:]
+    if "--spawn" in args:
+        args.remove("--spawn")
+        multiprocessing.set_start_method("spawn", force=True)
+    n = int(args[0]) if args else 40_000
+    f = Fernet(Fernet.generate_key())
+    rows = _rows(f, n)
+    cpus = os.cpu_count() or 1
+    print(f"n={n}  cpu={cpus}  start={multiprocessing.get_start_method()}  chunk={DECRYPT_CHUNK_SIZE}")
+    base = min(_ms(lambda: _decrypt_chunk(rows, f)) for _ in range(REPS))
+    print(f"  {'inline':<12} {base:9.1f} ms")
+    for workers in sorted({2, 4, cpus} - {1}):
+        for executor in ("thread", "process"):
+            label = f"{executor} x{workers}"
+            pool = _open_pool(f, workers=workers, executor=executor)
+            if pool is None:
+                print(f"  {label:<12} (プールを作れない)")
+                continue
+            try:
+                cold = _ms(lambda: _run(pool, rows, f))
+                warm = min(_ms(lambda: _run(pool, rows, f)) for _ in range(REPS))
+            finally:
+                pool.shutdown()
+            print(f"  {label:<12} {warm:9.1f} ms  x{base / warm:4.2f}  （初回 {cold:.1f} ms）")
+
+if __name__ == "__main__":
+    main()
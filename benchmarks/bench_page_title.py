@@ -0,0 +1,150 @@
+"""
+ページタイトル取り出しのベンチ（旧：本文を全部読む + apparent_encoding（全体で文字コード推定） + BeautifulSoup で全体を解析
+vs 新：page_title.title_from_chunks（</head> まで読む + 宣言から文字コード + 軽いパーサー、無いときだけ続きも流す）
+保存したページのフォルダを渡すとそれを使う（*.html / *.htm。Content-Type は <名前>.ctype があればその中身）。
+渡さなければ、よくある形のページ（大きな本文・Shift_JIS / EUC-JP・og:title だけ・<head> 無し 等）を作って使う。
+測る前に、作ったページでは正解のタイトルと、保存ページでは旧実装と同じになることを確かめる
+（旧実装は宣言を見ずに推定するので、作ったページでは旧実装の方が化けることがある。その数も出す）。
+  python benchmarks/bench_page_title.py [保存ページのフォルダ] [回数]
+"""
+import os, sys, time, random, glob
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from requests.compat import chardet
+from page_title import title_from_chunks, _normalize_title_text
+
+CHUNK = 16 * 1024
+
+# --- 旧実装（get_page_title の中身から通信を除いたもの） ---
+def _extract_title_from_html(html_text: str) -> str | None:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_text, "html.parser")
+    if soup.title and soup.title.string:
+        t = soup.title.string.strip()
+        if t: return t
+    og = soup.find("meta", property="og:title")
+    if og and og.get("content"):
+        t = og.get("content").strip()
+        if t: return t
+    tw = soup.find("meta", attrs={"name": "twitter:title"})
+    if tw and tw.get("content"):
+        t = tw.get("content").strip()
+        if t: return t
+    return None
+
+def reference_title(data: bytes, ctype: str) -> str | None:
+    enc = (chardet.detect(data) or {}).get("encoding") or "utf-8"  # Response.apparent_encoding と同じ
+    text = data.decode(enc, errors="replace")
+    if "html" not in ctype.lower() and "<html" not in text.lower():
+        return None
+    cand = _extract_title_from_html(text)
+    return _normalize_title_text(cand) if cand else None
+
+def new_title(data: bytes, ctype: str) -> tuple[str | None, int]:
+    read = [0]
+    def chunks():
+        for i in range(0, len(data), CHUNK):
+            read[0] += min(CHUNK, len(data) - i)
+            yield data[i:i + CHUNK]
+    cand, is_html = title_from_chunks(chunks(), ctype)
+    return (_normalize_title_text(cand) if is_html and cand else None), read[0]
+
+# --- コーパス ---
+_SAME_AS_OLD = object()  # 保存ページ: 正解が分からないので旧実装と比べる
+
+def _body(rnd, kb, text="本文の段落です。Lorem ipsum dolor sit amet. "):
+    parts = []
+    size = 0
+    while size < kb * 1024:
+        p = f'<div class="c{rnd.randint(0, 99)}"><p>{text * rnd.randint(1, 8)}</p><a href="/x/{rnd.randint(0, 10**6)}">link</a></div>\n'
+        parts.append(p); size += len(p.encode("utf-8"))
+    return "".join(parts)
+
+def _head(title, extra=""):
+    scripts = "".join(f'<script src="/static/app{i}.js"></script><link rel="stylesheet" href="/c{i}.css">' for i in range(20))
+    return f"<head><meta name=viewport content='width=device-width'>{scripts}{extra}<title>{title}</title></head>"
+
+def make_corpus(seed=0):
+    rnd = random.Random(seed)
+    pages = []
+    def add(name, expect, html_text, ctype="text/html; charset=utf-8", enc="utf-8"):
+        pages.append((name, html_text.encode(enc, errors="xmlcharrefreplace"), ctype, expect))
+    for kb in (8, 100, 600, 2000):
+        add(f"utf8-{kb}k", "ニュース記事 | サイト名 & 付録", f"<!doctype html><html>{_head('ニュース記事 | サイト名 &amp; 付録')}<body>{_body(rnd, kb)}</body></html>")
+    long_ja = "日本語のページタイトル（長め）・記事の見出しです"
+    add("sjis-header", long_ja, f"<html>{_head(long_ja)}<body>{_body(rnd, 200)}</body></html>", "text/html; charset=Shift_JIS", "cp932")
+    add("sjis-meta", long_ja, f"<html><head><meta http-equiv='Content-Type' content='text/html; charset=Shift_JIS'>"
+                     f"<title>{long_ja}</title></head><body>{_body(rnd, 200)}</body></html>", "text/html", "cp932")
+    add("eucjp-meta", long_ja, f"<html><head><meta charset=euc-jp><title>{long_ja}</title></head><body>{_body(rnd, 150)}</body></html>",
+        "text/html", "euc_jp")
+    add("latin1-meta", "Café déjà vu — résumé", f"<html><head><meta charset='iso-8859-1'><title>Café déjà vu — résumé</title></head>"
+                       f"<body>{_body(rnd, 50, 'Ça coûte très cher. ')}</body></html>", "text/html", "cp1252")
+    add("no-charset-utf8", "宣言の無いUTF-8のページ", f"<html>{_head('宣言の無いUTF-8のページ')}<body>{_body(rnd, 300)}</body></html>", "text/html")
+    add("og-only", "OGだけのタイトル", f"<html><head><meta property='og:title' content='OGだけのタイトル'>"
+                   f"<meta name='twitter:title' content='tw'></head><body>{_body(rnd, 80)}</body></html>")
+    add("twitter-only", "Twitter Card", f"<html><head><meta name='twitter:title' content=' Twitter  Card '></head><body>{_body(rnd, 20)}</body></html>")
+    add("empty-title-og", "空タイトルの代わり", f"<html><head><title>  </title><meta property=og:title content='空タイトルの代わり'></head><body></body></html>")
+    add("title-in-body", "本文の中のタイトル", f"<html><head><meta charset=utf-8></head><body><title>本文の中のタイトル</title>{_body(rnd, 400)}</body></html>")
+    add("no-head", "head の無いページ", f"<title>head の無いページ</title><p>{_body(rnd, 5)}</p>")
+    add("no-title", None, f"<html>{_head('').replace('<title></title>', '')}<body>{_body(rnd, 500)}</body></html>")
+    add("nested-title", "入れ子の代わり", f"<html><head><title>a<b>b</b></title><meta property='og:title' content='入れ子の代わり'></head>"
+                        f"<body>{_body(rnd, 10)}</body></html>")
+    add("entities", "Tom & Jerry 😀 <3", f"<html><head><title>Tom &amp;amp; Jerry &#x1F600; &lt;3</title></head><body>{_body(rnd, 10)}</body></html>")
+    add("upper-case", "UPPER CASE", f"<HTML><HEAD><TITLE>UPPER CASE</TITLE></HEAD><BODY>{_body(rnd, 300)}</BODY></HTML>")
+    add("bom-utf8", "BOM付き", "﻿" + f"<html>{_head('BOM付き')}<body>{_body(rnd, 30)}</body></html>", "text/html")
+    add("huge-head", "頭が大きい", f"<html><head>{'<script>var x=1;</script>' * 15000}<title>頭が大きい</title></head><body>{_body(rnd, 50)}</body></html>")
+    add("not-html", None, "%PDF-1.7 binary" + "x" * 50000, "application/pdf")
+    add("html-no-ctype", "Content-Type 無し", f"<html>{_head('Content-Type 無し')}<body>{_body(rnd, 20)}</body></html>", "")
+    return pages
+
+def load_dir(path):
+    pages = []
+    for fn in sorted(glob.glob(os.path.join(path, "*.htm*"))):
+        with open(fn, "rb") as fp:
+            data = fp.read()
+        ctype = "text/html"
+        if os.path.exists(fn + ".ctype"):
+            with open(fn + ".ctype", encoding="utf-8") as fp:
+                ctype = fp.read().strip()
+        pages.append((os.path.basename(fn), data, ctype, _SAME_AS_OLD))
+    return pages
+
+def check_equivalence(pages):
+    bad = []; old_wrong = 0
+    for name, data, ctype, expect in pages:
+        old = reference_title(data, ctype)
+        got, _ = new_title(data, ctype)
+        want = old if expect is _SAME_AS_OLD else expect
+        if want != got:
+            bad.append((name, want, got))
+        if expect is not _SAME_AS_OLD and old != expect:
+            old_wrong += 1
+            print(f"  old implementation: {name}: {old!r} (expected {expect!r})")
+    for name, want, got in bad[:10]:
+        print(f"  MISMATCH {name}: {want!r} != {got!r}")
+    print(f"equivalence: {len(pages)} pages, {len(bad)} mismatches ({old_wrong} wrong in the old implementation)")
+    return not bad
+
+def main():
+    args = sys.argv[1:]
+    pages = load_dir(args.pop(0)) if args and os.path.isdir(args[0]) else make_corpus()
+    reps = int(args[0]) if args else 5
+    if not check_equivalence(pages):
+        sys.exit(1)
+    total = sum(len(p[1]) for p in pages)
+    print(f"pages={len(pages)}  total={total / 1024 / 1024:.1f} MiB  reps={reps}")
+    print(f"  {'page':<16} {'size':>8} {'old ms':>9} {'new ms':>9} {'new read':>9}")
+    t_old = t_new = 0.0; read_new = 0
+    for name, data, ctype, _ in pages:
+        t0 = time.perf_counter()
+        for _ in range(reps): reference_title(data, ctype)
+        a = (time.perf_counter() - t0) / reps
+        t0 = time.perf_counter()
+        for _ in range(reps): _, read = new_title(data, ctype)
+        b = (time.perf_counter() - t0) / reps
+        t_old += a; t_new += b; read_new += read
+        print(f"  {name[:16]:<16} {len(data) // 1024:>6}KB {a*1000:9.2f} {b*1000:9.2f} {read // 1024:>7}KB")
+    print(f"  {'total':<16} {total // 1024:>6}KB {t_old*1000:9.1f} {t_new*1000:9.1f} {read_new // 1024:>7}KB")
+
+if __name__ == "__main__":
+    main()
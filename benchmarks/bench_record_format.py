@@ -0,0 +1,50 @@
+"""
+レコード暗号化フォーマットのベンチ（v1: 1行5トークン vs v2: 1行1トークン）
+  python benchmarks/bench_record_format.py [件数]
+"""
+import os, sys, time, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import (
+    create_vault_key, open_db, close_db, init_db, ensure_group_column, get_db, compute_url_hash,
+    get_all_bookmarks, invalidate_cache, migrate_to_record_format
+)
+
+def _fill_legacy(n, f):
+    """v1 形式の行を直接書き込む（旧バージョンのDBを再現）。"""
+    rows = []
+    for i in range(n):
+        url = f"https://example{i % 97}.com/articles/{i}?page={i % 7}"
+        rows.append((
+            f.encrypt(f"example{i % 97}.com".encode()), f.encrypt(f"Article title number {i}".encode()),
+            f.encrypt(url.encode()), f.encrypt(b"python, memo"), f.encrypt(f"example{i % 97}.com".encode()),
+            compute_url_hash(url)
+        ))
+    with get_db().transaction() as conn:
+        conn.executemany("""INSERT INTO bookmarks (enc_domain, enc_title, enc_url, enc_tags, enc_group, url_hash)
+                            VALUES (?, ?, ?, ?, ?, ?);""", rows)
+
+def _cold_load(f):
+    invalidate_cache()
+    t0 = time.perf_counter()
+    n = len(get_all_bookmarks(f))
+    return n, time.perf_counter() - t0
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as d:
+        open_db(os.path.join(d, "bench.db")); init_db(); ensure_group_column()
+        f = create_vault_key("bench-password")
+        _fill_legacy(n, f)
+        rows, t_v1 = _cold_load(f)
+        print(f"n={n}")
+        print(f"  get_all_bookmarks v1  {t_v1*1000:9.1f} ms  ({rows} rows)")
+        t0 = time.perf_counter(); migrated = migrate_to_record_format(f)
+        print(f"  migrate v1 -> v2      {(time.perf_counter()-t0)*1000:9.1f} ms  ({migrated} rows)")
+        rows, t_v2 = _cold_load(f)
+        print(f"  get_all_bookmarks v2  {t_v2*1000:9.1f} ms  ({rows} rows)")
+        print(f"  speedup               {t_v1/t_v2:9.2f} x")
+        close_db()
+
+if __name__ == "__main__":
+    main()
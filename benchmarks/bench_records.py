@@ -0,0 +1,37 @@
+"""
+復号済みレコードのメモリ比較（旧：1件ごとの dict vs 新：__slots__ の Bookmark）
+  python benchmarks/bench_records.py [件数]
+"""
+import os, sys, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import Bookmark
+
+def _values(n):
+    # 復号直後と同じく、毎回別々の str オブジェクトとして作る
+    for i in range(n):
+        d = f"example{i % 97}.com"
+        yield (i + 1, "".join(d), f"title {i}", f"https://{d}/path/{i}", "python, memo, 後で読む",
+               "".join(d), f"{i:064x}")
+
+def as_dict(v):
+    return {"id": v[0], "domain": v[1], "title": v[2], "url": v[3], "tags": v[4], "group": v[5], "url_hash": v[6]}
+
+def _measure(label, n, make):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    recs = [make(v) for v in _values(n)]
+    dt = time.perf_counter() - t0
+    cur, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<10} {cur / n:7.1f} B/件  {cur / 2**20:7.1f} MiB  {dt*1000:8.1f} ms")
+    return recs
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"n={n}")
+    _measure("dict", n, as_dict)
+    _measure("Bookmark", n, lambda v: Bookmark(*v))
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,52 @@ TITLE_SUFFIX   = "©️2025 KisaragiIchigo"
 DB_FILE        = "secret_bookmarks.db"
 UI_FONT_FAMILY = "メイリオ"
 
+# ===== 一括復号（アンロック時の全件読み込みなど） =====
+DECRYPT_EXECUTOR      = "process"  # "process"（CPUコア数でスケール）/ "thread"
+DECRYPT_WORKERS       = 0          # 0 = os.cpu_count()
+DECRYPT_CHUNK_SIZE    = 2000       # 1タスクあたりの行数
+DECRYPT_PARALLEL_MIN  = 5000       # これ未満の行数なら並列化せずその場で復号
+
+# ===== 一覧のページ読み（追加順・絞り込み無しのとき、見える分から復号する） =====
+LIST_PAGE_SIZE = 200
+
+# ===== ファビコン =====
+ICON_FETCH_WORKERS   = 4      # 取りに行くスレッド数（同じドメインへは同時に1つだけ）
+ICON_STORE_FILE      = "favicons.db"  # ディスクキャッシュ（設定フォルダの下）
+ICON_HIT_TTL_DAYS    = 30     # 取れたアイコンを取り直すまでの日数
+ICON_MISS_TTL_HOURS  = 12     # 取れなかったドメインを取り直すまでの時間
+ICON_STORE_MAX_BYTES = 4 * 1024 * 1024  # 超えたら最近使っていないものから消す
+ICON_STORE_ENCRYPT   = True   # 保管庫の鍵でドメイン・画像を隠す
+
+# ===== HTTP（タイトル・ファビコン取得） =====
+HTTP_POOL_SIZE           = 10    # 使い回す keep-alive 接続の数（ホストごと）
+HTTP_PER_HOST            = 2     # 同じホストへ同時に出す要求の数
+HTTP_REDIRECT_CACHE_SIZE = 1024  # 覚えておく恒久リダイレクト（301 / 308）の数
+HTTP_TITLE_BUDGET_SEC    = 8     # タイトル1件の取得にかける時間の上限（リトライ込み）
+HTTP_ICON_BUDGET_SEC     = 6     # ファビコン1件の取得にかける時間の上限（ページ + 画像）
+TITLE_HEAD_MAX_BYTES     = 256 * 1024       # タイトルを探すのに読む上限（</head> が来ればそこまで）
+TITLE_FULL_MAX_BYTES     = 4 * 1024 * 1024  # <head> に無いときに全体を読む上限
+TITLE_FETCH_WORKERS      = 2     # タイトルを裏で取りに行くスレッド数（同じ URL へは同時に1つだけ）
+TITLE_CACHE_SIZE         = 256   # 取れたタイトルを覚えておく数（同じ URL を何度コピーしても取り直さない）
+
+# ===== 設定ファイル =====
+SETTINGS_SAVE_DELAY_MS = 1000  # 変更をまとめて書くまでの待ち（連続した並び替え・移動は1回の書き込みに）
+
+# ===== パスワードからの鍵導出（KDF） =====
+KDF_TARGET_MS = 250   # アンロック1回あたりの目標時間。新規作成・移行時にこの時間になるよう較正する
+
+# ===== キーワード検索インデックス（オプトイン） =====
+# True にすると、3文字単位（trigram）の鍵付きハッシュ索引を DB に持ち、復号せずに候補を絞る。
+# 1件あたり百行程度の索引が増えるので、大きな保管庫で検索が重いときだけ有効にする。
+SEARCH_INDEX_ENABLED  = False
+
+# ===== バックアップ（SQLite のオンラインバックアップ） =====
+BACKUP_DIR            = "backups"
+BACKUP_KEEP           = 5      # 残す世代数
+BACKUP_INTERVAL_MIN   = 30     # 自動バックアップを確かめる間隔（分）。0 で無効。変更が無ければ取らない
+BACKUP_PAGES_PER_STEP = 64     # 1ステップで写すページ数（小さいほどアプリの書き込みを待たせない）
+BACKUP_VERIFY         = True   # 写した後に整合性チェックをして SHA-256 を記録する
+
 # ===== カラーパレット =====
 PRIMARY_COLOR       = "#4169e1"
 HOVER_COLOR         = "#7000e0"
@@ -0,0 +1,142 @@
+"""
+ブックマークの書き出し（Netscape HTML / JSON Lines / CSV）。
+  - iter_bookmarks で少しずつ復号しながら1件ずつ書くので、保管庫全体をメモリに載せない
+  - passphrase を渡すと、保管庫とは別のパスフレーズで暗号化したファイルにする（decrypt_export で戻せる）
+  - 一時ファイルに書いてから置き換えるので、途中で失敗しても既存のファイルは壊れない
+"""
+import os, csv, json, time, html, struct
+from types import SimpleNamespace
+from cryptography.fernet import Fernet, InvalidToken
+from processor import get_db, iter_bookmarks, derive_key, calibrate_kdf
+
+FORMATS = ("html", "jsonl", "csv")
+_FIELDS = ("title", "url", "tags", "group", "domain")
+
+# --- 形式ごとの書き手（write は文字列を受け取る関数） ---
+def _write_html(write, rows):
+    write("<!DOCTYPE NETSCAPE-Bookmark-file-1>\n"
+          '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+          "<TITLE>Bookmarks</TITLE>\n<H1>Bookmarks</H1>\n<DL><p>\n")
+    for bm in rows:
+        tags = html.escape(bm["tags"].replace(", ", ","), quote=True)
+        write(f'    <DT><A HREF="{html.escape(bm["url"], quote=True)}" TAGS="{tags}">'
+              f'{html.escape(bm["title"], quote=False)}</A>\n')
+        yield
+    write("</DL><p>\n")
+
+def _write_jsonl(write, rows):
+    for bm in rows:
+        rec = {k: bm[k] for k in _FIELDS}
+        rec["tags"] = [t.strip() for t in bm["tags"].split(",") if t.strip()]
+        write(json.dumps(rec, ensure_ascii=False) + "\n")
+        yield
+
+def _write_csv(write, rows):
+    w = csv.writer(SimpleNamespace(write=write), lineterminator="\n")
+    w.writerow(_FIELDS)
+    for bm in rows:
+        w.writerow([bm[k] for k in _FIELDS])
+        yield
+
+_WRITERS = {"html": _write_html, "jsonl": _write_jsonl, "csv": _write_csv}
+
+# --- パスフレーズ付きの書き出し ---
+# 1行目: ヘッダ（JSON。KDF パラメータと中身の形式）
+# 以降: 1行1トークン。平文は 8バイトの通し番号 + 最大 _CHUNK バイト。最後に空のチャンクを終端として置く
+#       （通し番号と終端で、チャンクの抜け・入れ替え・切り詰めを検出する）
+_MAGIC = "SecretBookMarks-export"
+_CHUNK = 1 << 16
+
+class _EncryptedWriter:
+    def __init__(self, fh, f: Fernet):
+        self.fh = fh; self.f = f
+        self.buf = []; self.size = 0; self.seq = 0
+
+    def write(self, s: str):
+        b = s.encode("utf-8")
+        self.buf.append(b); self.size += len(b)
+        if self.size >= _CHUNK:
+            self._flush(b"".join(self.buf))
+
+    def _flush(self, data: bytes):
+        for i in range(0, len(data), _CHUNK):
+            self._token(data[i:i + _CHUNK])
+        self.buf = []; self.size = 0
+
+    def _token(self, data: bytes):
+        self.fh.write(self.f.encrypt(struct.pack(">Q", self.seq) + data) + b"\n")
+        self.seq += 1
+
+    def close(self):
+        self._flush(b"".join(self.buf))
+        self._token(b"")  # 終端
+
+def decrypt_export(src: str, dst: str, passphrase: str):
+    """export_bookmarks(passphrase=...) で作ったファイルを平文に戻す。パスフレーズ違い・改ざんは ValueError。"""
+    with open(src, "rb") as fh:
+        header = json.loads(fh.readline())
+        if header.get("format") != _MAGIC:
+            raise ValueError("書き出しファイルではありません")
+        f = Fernet(derive_key(passphrase, header["kdf"]))
+        tmp = dst + ".tmp"
+        with open(tmp, "wb") as out:
+            seq = 0; ended = False
+            for line in fh:
+                if ended:
+                    raise ValueError("終端の後にデータがあります")
+                try:
+                    plain = f.decrypt(line.strip())
+                except InvalidToken:
+                    raise ValueError("パスフレーズが違うか、ファイルが壊れています") from None
+                if struct.unpack(">Q", plain[:8])[0] != seq:
+                    raise ValueError("チャンクの順番が合いません")
+                seq += 1
+                if len(plain) == 8:
+                    ended = True
+                out.write(plain[8:])
+            if not ended:
+                raise ValueError("ファイルが途中で切れています")
+    os.replace(tmp, dst)
+    return header.get("content")
+
+# --- 書き出し ---
+def export_bookmarks(path: str, f: Fernet, *, fmt: str = "html", passphrase: str | None = None,
+                     batch_size: int = 1000, progress=None) -> dict:
+    """
+    全ブックマークを path に書き出す（id 順）。
+      - fmt: "html"（Netscape 形式。ブラウザ・importer で読める）/ "jsonl" / "csv"
+      - passphrase: 指定すると KDF で導出した鍵で暗号化する
+    progress(書いた件数, 総数) を batch_size 件ごとに呼ぶ。
+    戻り値は {"rows", "seconds", "rows_per_sec"}。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    total = get_db().execute("SELECT COUNT(*) FROM bookmarks;").fetchone()[0]
+    tmp = path + ".tmp"
+    t0 = time.perf_counter()
+    done = 0
+    try:
+        if passphrase:
+            params = calibrate_kdf()
+            fh = open(tmp, "wb")
+            fh.write(json.dumps({"format": _MAGIC, "version": 1, "kdf": params, "content": fmt}).encode("utf-8") + b"\n")
+            out = _EncryptedWriter(fh, Fernet(derive_key(passphrase, params)))
+        else:
+            fh = out = open(tmp, "w", encoding="utf-8", newline="")
+        with fh:
+            rows = iter_bookmarks(f, fields=_FIELDS, batch_size=batch_size)
+            for _ in _WRITERS[fmt](out.write, rows):
+                done += 1
+                if progress and done % batch_size == 0:
+                    progress(done, total)
+            if passphrase:
+                out.close()
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if progress:
+        progress(done, total)
+    dt = time.perf_counter() - t0
+    return {"rows": done, "seconds": dt, "rows_per_sec": done / dt if dt > 0 else 0.0}
@@ -0,0 +1,106 @@
+"""
+ファビコンのディスクキャッシュ（app_config_dir() の下の SQLite）。
+  - 24x24 に縮めた PNG をドメインごとに持つ。取れなかったドメインも「無し」として覚える（負のキャッシュ）
+  - 取れたものは ICON_HIT_TTL_DAYS、取れなかったものは ICON_MISS_TTL_HOURS で期限切れ（取り直す）
+  - 合計が ICON_STORE_MAX_BYTES を超えたら、最近使っていないものから消す
+  - f（保管庫の鍵）を渡すと、ドメインは鍵付きハッシュ・PNG は暗号化して置く（ドメインがファイルから読めない）
+GUI スレッドからだけ使う（接続は1本）。
+"""
+import os, time, hmac, hashlib, sqlite3
+from cryptography.fernet import Fernet, InvalidToken
+from config import ICON_STORE_FILE, ICON_HIT_TTL_DAYS, ICON_MISS_TTL_HOURS, ICON_STORE_MAX_BYTES
+from utils import app_config_dir
+
+_TOUCH_INTERVAL = 24 * 3600  # used_at の書き換えは1日1回まで（一覧を開くたびに書き込まないため）
+
+class FaviconStore:
+    def __init__(self, path: str | None = None, f: Fernet | None = None, *,
+                 hit_ttl: float = ICON_HIT_TTL_DAYS * 86400, miss_ttl: float = ICON_MISS_TTL_HOURS * 3600,
+                 max_bytes: int = ICON_STORE_MAX_BYTES):
+        self.path = path or os.path.join(app_config_dir(), ICON_STORE_FILE)
+        self.f = f
+        self.hit_ttl = hit_ttl; self.miss_ttl = miss_ttl; self.max_bytes = max_bytes
+        self._conn: sqlite3.Connection | None = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("""CREATE TABLE IF NOT EXISTS icons (
+                                key        BLOB PRIMARY KEY,
+                                png        BLOB,              -- NULL = 取れなかった
+                                size       INTEGER NOT NULL,
+                                fetched_at INTEGER NOT NULL,
+                                used_at    INTEGER NOT NULL
+                            );""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_icons_used ON icons(used_at);")
+            self._conn = conn
+        return self._conn
+
+    def _key(self, domain: str) -> bytes:
+        if self.f is None:
+            return domain.encode("utf-8")
+        return hmac.new(self.f.index_key, b"favicon:" + domain.encode("utf-8"), hashlib.sha256).digest()[:16]
+
+    def lookup(self, domain: str) -> tuple[bytes | None, int] | None:
+        """
+        (PNG or None（取れなかった）, 期限（UNIX 時刻）) を返す。覚えていなければ None。
+        復号できない（鍵が違う）ものは覚えていない扱い。
+        """
+        key = self._key(domain)
+        row = self.conn.execute("SELECT png, fetched_at, used_at FROM icons WHERE key=?;", (key,)).fetchone()
+        if row is None:
+            return None
+        png, fetched_at, used_at = row
+        now = int(time.time())
+        if png is not None and self.f is not None:
+            try:
+                png = self.f.decrypt(png)
+            except InvalidToken:
+                return None
+        if now - used_at > _TOUCH_INTERVAL:
+            self.conn.execute("UPDATE icons SET used_at=? WHERE key=?;", (now, key))
+        return png, int(fetched_at + (self.hit_ttl if png is not None else self.miss_ttl))
+
+    def put(self, domain: str, png: bytes | None):
+        """取れた PNG（取れなければ None）を覚える。取り直しに失敗したときは前の PNG を残して期限だけ延ばす。"""
+        key = self._key(domain)
+        now = int(time.time())
+        if png is None:
+            cur = self.conn.execute("UPDATE icons SET fetched_at=?, used_at=? WHERE key=? AND png IS NOT NULL;",
+                                    (now, now, key))
+            if cur.rowcount:
+                return
+        data = self.f.encrypt(png) if png is not None and self.f is not None else png
+        self.conn.execute("INSERT OR REPLACE INTO icons (key, png, size, fetched_at, used_at) VALUES (?, ?, ?, ?, ?);",
+                          (key, data, len(data or b"") + len(key), now, now))
+        self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM icons;").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 古い順に、上限の 9 割まで減らす（上限付近で毎回消さないように）
+        target = total - int(self.max_bytes * 0.9)
+        drop = []; freed = 0
+        for key, size in self.conn.execute("SELECT key, size FROM icons ORDER BY used_at, fetched_at;"):
+            drop.append((key,)); freed += size
+            if freed >= target:
+                break
+        self.conn.executemany("DELETE FROM icons WHERE key=?;", drop)
+
+    def set_key(self, f: Fernet | None):
+        """鍵を替える（パスワード変更後など）。前の鍵で置いたものは読めないので消す。"""
+        if f is not self.f:
+            self.f = f
+            self.clear()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM icons;")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,26 +1,40 @@
-import os, sys, webbrowser, re, html, time
+import os, sys, webbrowser, re, time, bisect, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, urljoin
-from PySide6.QtCore import Qt, QEvent, QPoint, QRect, QTimer, QByteArray, QSize
+from PySide6.QtCore import Qt, QEvent, QPoint, QRect, QTimer, QByteArray, QSize, QObject, Signal, QBuffer, QIODevice
 from PySide6.QtGui import QIcon, QFont, QPixmap, QImage
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit,
     QComboBox, QTreeWidget, QTreeWidgetItem, QMessageBox, QDialog, QTextBrowser,
     QSizePolicy, QStyle, QGraphicsDropShadowEffect, QHeaderView, QFormLayout,
-    QRadioButton, QButtonGroup
+    QRadioButton, QButtonGroup, QFileDialog
 )
 
 from config import (
-    APP_TITLE, UI_FONT_FAMILY, DB_FILE, TITLE_SUFFIX,
-    build_qss, GAP_DEFAULT, PADDING_CARD
+    APP_TITLE, UI_FONT_FAMILY, TITLE_SUFFIX,
+    build_qss, GAP_DEFAULT, PADDING_CARD, LIST_PAGE_SIZE, BACKUP_INTERVAL_MIN, SETTINGS_SAVE_DELAY_MS,
+    ICON_FETCH_WORKERS, ICON_STORE_ENCRYPT, ICON_MISS_TTL_HOURS, HTTP_ICON_BUDGET_SEC,
+    TITLE_FETCH_WORKERS, TITLE_CACHE_SIZE
 )
 from utils import (
-    resource_path, is_url, extract_domain, load_settings_json, save_settings_json, normalize_url
+    resource_path, is_url, extract_domain, get_settings, normalize_url
 )
 from processor import (
     init_db, get_fernet, get_all_bookmarks, add_bookmark_to_db,
     update_bookmark_full, delete_bookmark_by_id, collect_all_tags, ensure_group_column,
-    update_bookmark_tags, migrate_populate_url_hash, compute_url_hash, find_bookmark_by_urlhash
+    migrate_populate_url_hash, compute_url_hash, find_bookmark_by_urlhash,
+    close_db, migrate_to_record_format, migrate_tags_to_table, update_tags_bulk, find_ids_by_tags,
+    ensure_search_index, find_ids_by_keywords, get_bookmarks_by_ids, search_text,
+    is_new_vault, check_password, write_key_check, create_vault_key, needs_kdf_upgrade, upgrade_kdf,
+    get_bookmarks_page, bookmarks_cached, delete_bookmarks_bulk, change_password
 )
+from importer import detect_format, import_bookmarks
+from exporter import export_bookmarks
+from backup import BackupScheduler
+from favicon_store import FaviconStore
+from http_client import get_client
+from page_title import get_page_title, read_head, sniff_charset, decode_html, PAGE_HEADERS
 
 # ===== 定数：並び替えモード =====
 SORT_NEW_TO_OLD = 0
@@ -42,62 +56,19 @@ def apply_drop_shadow(widget: QWidget) -> QGraphicsDropShadowEffect:
     widget.setGraphicsEffect(eff)
     return eff
 
-# ===== 軽量タイトル取得 =====
-def _normalize_title_text(raw: str) -> str:
-    t = html.unescape(raw or "")
-    t = re.sub(r"\s+", " ", t).strip()
-    return t or ""
-
-def _extract_title_from_html(html_text: str) -> str | None:
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html_text, "html.parser")
-    if soup.title and soup.title.string:
-        t = soup.title.string.strip()
-        if t: return t
-    og = soup.find("meta", property="og:title")
-    if og and og.get("content"):
-        t = og.get("content").strip()
-        if t: return t
-    tw = soup.find("meta", attrs={"name": "twitter:title"})
-    if tw and tw.get("content"):
-        t = tw.get("content").strip()
-        if t: return t
-    return None
-
-def _http_get(url: str, *, timeout=(3, 6), headers: dict | None = None) -> tuple[str | None, dict]:
+# ===== ページの <head> 取得 =====
+def _http_get_head(url: str, *, timeout=(3, 6)) -> str | None:
+    """ページを </head> まで読んで文字列にする（本文全体は読まない）。"""
+    res = get_client().get(url, headers=PAGE_HEADERS, timeout=timeout, stream=True)
+    if res is None:
+        return None
     try:
-        import requests
-        _headers = {
-            "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                           "AppleWebKit/537.36 (KHTML, like Gecko) "
-                           "Chrome/124.0.0.0 Safari/537.36"),
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
-            "Referer": "https://www.google.com/",
-        }
-        if headers: _headers.update(headers)
-        res = requests.get(url, headers=_headers, timeout=timeout, allow_redirects=True)
-        res.encoding = res.apparent_encoding or res.encoding
-        return res.text, res.headers
+        head, _ = read_head(res.iter_content(16 * 1024))
+        return decode_html(head, sniff_charset(head, res.headers.get("Content-Type") or "")) if head else None
     except Exception:
-        return None, {}
-
-def get_page_title(url: str) -> str:
-    if not is_url(url): return url
-    try:
-        for i in range(2):
-            text, headers = _http_get(url, timeout=(2 + i, 4 + 2*i))
-            if not text:
-                time.sleep(0.1 * (2 ** i)); continue
-            ctype = (headers.get("Content-Type") or "").lower()
-            if "html" not in ctype and "<html" not in (text.lower() if text else ""):
-                return url
-            cand = _extract_title_from_html(text)
-            if cand:
-                return _normalize_title_text(cand)
-    except Exception:
-        pass
-    return url
+        return None
+    finally:
+        res.close()
 
 # ===== ファビコン =====
 ICON_CACHE: dict[str, QIcon] = {}
@@ -116,40 +87,179 @@ def _extract_favicon_from_html(base_url: str, html_text: str) -> str | None:
     return None
 
 def _http_get_bytes(url: str, *, timeout=(3, 6)) -> bytes | None:
+    res = get_client().get(url, timeout=timeout)
     try:
-        import requests
-        res = requests.get(url, headers={
-            "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                           "AppleWebKit/537.36 (KHTML, like Gecko) "
-                           "Chrome/124.0.0.0 Safari/537.36"),
-        }, timeout=timeout, allow_redirects=True)
-        if res.status_code == 200:
+        if res is not None and res.status_code == 200:
             return res.content
     except Exception:
         pass
     return None
 
-def get_site_icon(url: str, *, fetch_timeout=(2, 4)) -> QIcon | None:
-    domain = extract_domain(url)
-    if domain in ICON_CACHE: return ICON_CACHE[domain]
+def _fetch_icon_image(url: str, *, fetch_timeout=(2, 4)) -> QImage | None:
+    """サイトのファビコンを取ってきて 24x24 に縮める（QPixmap を使わないのでワーカースレッドから呼べる）。"""
     try:
-        root = _domain_root(url)
-        text, _ = _http_get(root, timeout=fetch_timeout)
-        icon_url = _extract_favicon_from_html(root, text) if text else None
-        if not icon_url:
-            icon_url = urljoin(root, "favicon.ico")
-        data = _http_get_bytes(icon_url, timeout=fetch_timeout)
+        with get_client().budget(HTTP_ICON_BUDGET_SEC):
+            root = _domain_root(url)
+            text = _http_get_head(root, timeout=fetch_timeout)
+            icon_url = _extract_favicon_from_html(root, text) if text else None
+            if not icon_url:
+                icon_url = urljoin(root, "favicon.ico")
+            data = _http_get_bytes(icon_url, timeout=fetch_timeout)
         if data:
             img = QImage.fromData(QByteArray(data))
             if not img.isNull():
-                pm = QPixmap.fromImage(img).scaled(24,24, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                ICON_CACHE[domain] = QIcon(pm)
-                return ICON_CACHE[domain]
+                return img.scaled(24, 24, Qt.KeepAspectRatio, Qt.SmoothTransformation)
     except Exception:
         pass
-    ICON_CACHE[domain] = None
     return None
 
+def _fetch_icon_png(url: str) -> bytes | None:
+    """_fetch_icon_image を PNG にする（ディスクキャッシュに置く形。ワーカースレッド用）。"""
+    img = _fetch_icon_image(url)
+    if img is None:
+        return None
+    buf = QBuffer(); buf.open(QIODevice.WriteOnly)
+    img.save(buf, "PNG")
+    return bytes(buf.data())
+
+def _icon_from_png(png: bytes) -> QIcon | None:
+    pm = QPixmap()
+    return QIcon(pm) if pm.loadFromData(png, "PNG") else None
+
+class IconLoader(QObject):
+    """
+    ファビコンをワーカースレッドで取りに行く（同じドメインは同時に1つだけ）。
+    store（FaviconStore）があればまずそこを見て、取れた・取れなかったを覚えておく（期限が切れたら取り直す）。
+    取り終わると（取れなくても）GUI スレッドで iconReady(ドメイン, QIcon or None) を出す。
+    """
+    iconReady = Signal(str, object)
+    _fetched = Signal(str, object)  # ワーカー → GUI スレッド（PNG or None）
+
+    def __init__(self, parent=None, *, store=None, workers: int = ICON_FETCH_WORKERS):
+        super().__init__(parent)
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="favicon")
+        self._inflight: set[str] = set()
+        self._missed: dict[str, float] = {}  # 取れなかったドメイン → 取り直してよい時刻
+        self._fetched.connect(self._on_fetched)  # 別スレッドからの emit はキュー経由で届く
+
+    def icon(self, domain: str, url: str) -> QIcon | None:
+        """
+        手元（メモリ → ディスク）にあれば返す。無い・期限切れなら取りに行き始める（届いたら iconReady）。
+        期限切れのものは取り直している間も古いアイコンを返す。
+        """
+        icon = ICON_CACHE.get(domain)
+        if icon is not None or not domain or domain in self._inflight:
+            return icon
+        now = time.time()
+        if self._missed.get(domain, 0) > now:
+            return None
+        if self.store is not None:
+            entry = self.store.lookup(domain)
+            if entry is not None:
+                png, expires = entry
+                if png is not None:
+                    icon = ICON_CACHE[domain] = _icon_from_png(png)
+                if expires > now:
+                    if icon is None:
+                        self._missed[domain] = expires
+                    return icon
+        self._inflight.add(domain)
+        self._pool.submit(_fetch_icon_png, url).add_done_callback(lambda fut, d=domain: self._done(d, fut))
+        return icon
+
+    def pending(self, domain: str) -> bool:
+        return domain in self._inflight
+
+    def _done(self, domain: str, fut):
+        # ワーカースレッドで呼ばれる
+        png = None if fut.cancelled() else fut.result()
+        try:
+            self._fetched.emit(domain, png)
+        except RuntimeError:
+            pass  # ウィンドウが先に閉じられた
+
+    def _on_fetched(self, domain: str, png):
+        self._inflight.discard(domain)
+        icon = _icon_from_png(png) if png else None
+        if self.store is not None:
+            self.store.put(domain, png if icon is not None else None)
+        if icon is not None:
+            ICON_CACHE[domain] = icon
+        elif ICON_CACHE.get(domain) is None:
+            self._missed[domain] = time.time() + (self.store.miss_ttl if self.store else ICON_MISS_TTL_HOURS * 3600)
+        self.iconReady.emit(domain, ICON_CACHE.get(domain))
+
+    def shutdown(self):
+        """取りに行っていないものは捨てる（通信中のものはタイムアウトまでに終わる）。"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self.store is not None:
+            self.store.close()
+
+class TitleLoader(QObject):
+    """
+    ページタイトルをワーカースレッドで取りに行く（同じ URL は同時に1つだけ。取れた結果は覚えておく）。
+    取り終わると GUI スレッドで titleReady(URL, タイトル（取れなければ URL そのもの）) を出す。
+    """
+    titleReady = Signal(str, str)
+    _fetched = Signal(str, object)  # ワーカー → GUI スレッド（Future）
+
+    def __init__(self, parent=None, *, workers: int = TITLE_FETCH_WORKERS, cache_size: int = TITLE_CACHE_SIZE):
+        super().__init__(parent)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="title")
+        self._inflight: dict[str, tuple] = {}  # URL → (Future, 取りやめの Event)
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._cache_size = cache_size
+        self._fetched.connect(self._on_fetched)
+
+    def title(self, url: str) -> str | None:
+        """取ってあれば返す。無ければ取りに行き始めて（取りに行っている最中ならそのまま）None。"""
+        if url in self._cache:
+            self._cache.move_to_end(url)
+            return self._cache[url]
+        if url not in self._inflight:
+            cancel = threading.Event()
+            fut = self._pool.submit(get_page_title, url, cancel=cancel)
+            self._inflight[url] = (fut, cancel)
+            fut.add_done_callback(lambda fut, u=url: self._done(u, fut))
+        return None
+
+    def cancel(self, url: str):
+        """取りやめる（待っているものは捨て、通信中のものは読みかけで止める）。結果は覚えない。"""
+        entry = self._inflight.pop(url, None)
+        if entry is not None:
+            fut, cancel = entry
+            cancel.set(); fut.cancel()
+
+    def _done(self, url: str, fut):
+        # ワーカースレッドで呼ばれる
+        if fut.cancelled():
+            return
+        try:
+            self._fetched.emit(url, fut)
+        except RuntimeError:
+            pass  # ウィンドウが先に閉じられた
+
+    def _on_fetched(self, url: str, fut):
+        entry = self._inflight.get(url)
+        if entry is None or entry[0] is not fut:
+            return  # 取りやめた
+        del self._inflight[url]
+        try:
+            title = fut.result()
+        except Exception:
+            title = url
+        if title != url:  # 取れなかったものは覚えない（次に頼まれたら取り直す）
+            self._cache[url] = title
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        self.titleReady.emit(url, title)
+
+    def shutdown(self):
+        for url in list(self._inflight):
+            self.cancel(url)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
 def get_page_thumbnail(url: str, *, max_size: QSize = QSize(360, 200)) -> QPixmap | None:
     return None
 
@@ -245,6 +355,7 @@ class BookmarkEditDialog(QDialog):
 
         self._moving = False
         self._drag_offset = QPoint()
+        self._title_loader = None; self._title_url = None  # fetch_title で裏取得中の URL
 
         outer = QVBoxLayout(self); outer.setContentsMargins(0,0,0,0); outer.setSpacing(0)
         bg = QWidget(); bg.setObjectName("bgRoot"); outer.addWidget(bg)
@@ -298,6 +409,50 @@ class BookmarkEditDialog(QDialog):
             return
         self.accept()
 
+    # --- タイトルの裏取得 ---
+    def fetch_title(self, loader: TitleLoader):
+        """URL のタイトルを裏で取り、届いたら空のタイトル欄に入れる。タイトルか URL を自分で打ったら取りやめる。"""
+        url = self.ed_url.text().strip()
+        title = loader.title(url)
+        if title is not None:
+            if not self.ed_title.text(): self.ed_title.setText(title)
+            return
+        self._title_loader = loader; self._title_url = url
+        self.ed_title.setPlaceholderText("タイトルを取得中…")
+        loader.titleReady.connect(self._on_title_ready)
+        self.ed_title.textEdited.connect(self._cancel_title)
+        self.ed_url.textEdited.connect(self._cancel_title)
+        self.finished.connect(self._on_title_dialog_finished)
+
+    def _on_title_ready(self, url: str, title: str):
+        if url != self._title_url:
+            return
+        self._stop_title()
+        if title != url and not self.ed_title.text():
+            self.ed_title.setText(title)
+
+    def _cancel_title(self, *_):
+        if self._title_url is not None:
+            self._title_loader.cancel(self._title_url)
+            self._stop_title()
+
+    def _on_title_dialog_finished(self, result: int):
+        # 保存したときは取り続ける（タイトルが空なら、届いたところで保存した行を書き換える）
+        if result != QDialog.Accepted:
+            self._cancel_title()
+        else:
+            self._stop_title()
+
+    def _stop_title(self):
+        if self._title_url is None:
+            return
+        self._title_url = None
+        try:
+            self._title_loader.titleReady.disconnect(self._on_title_ready)
+        except (RuntimeError, TypeError):
+            pass
+        self.ed_title.setPlaceholderText("ページタイトル（空なら自動取得）")
+
 # ===== README =====
 class ReadmeDialog(QDialog):
     def __init__(self, parent=None):
@@ -378,7 +533,17 @@ class MainWindow(QWidget):
         # 認証 & マイグレーション
         init_db(); ensure_group_column()
         self._password_flow()
-        migrate_populate_url_hash(self.f)
+        migrate_to_record_format(self.f)
+        self._migrate_url_hash()
+        self._migrate_tags()
+        self._build_search_index()
+
+        # 設定（読むのは1回だけ。書き込みはまとめて SETTINGS_SAVE_DELAY_MS 後に1回）
+        self.settings = get_settings()
+        self.settings_timer = QTimer(self); self.settings_timer.setSingleShot(True)
+        self.settings_timer.setInterval(SETTINGS_SAVE_DELAY_MS)
+        self.settings_timer.timeout.connect(self.settings.flush)
+        self.settings.on_change = self.settings_timer.start
 
         # 位置・サイズ復元
         self._restore_geometry()
@@ -399,7 +564,7 @@ class MainWindow(QWidget):
 
         # 検索行
         row = QHBoxLayout()
-        self.edit_search = QLineEdit(); self.edit_search.setPlaceholderText("キーワード検索（スペースでAND）")
+        self.edit_search = QLineEdit(); self.edit_search.setPlaceholderText("キーワード検索（スペースでAND / #タグ で完全一致）")
         self.combo_tag   = QComboBox(); self.combo_tag.setMinimumWidth(140)
         self.combo_sort  = QComboBox(); self.combo_sort.setMinimumWidth(190)
         self.combo_sort.addItems([
@@ -413,8 +578,12 @@ class MainWindow(QWidget):
         self.btn_edit    = QPushButton("編集")
         self.btn_del     = QPushButton("削除")
         self.btn_tagbulk = QPushButton("タグ一括")
+        self.btn_import  = QPushButton("取り込み")
+        self.btn_export  = QPushButton("書き出し")
+        self.btn_passwd  = QPushButton("パスワード変更")
         self.btn_readme  = QPushButton("README")
-        for b in (self.btn_search, self.btn_add, self.btn_edit, self.btn_del, self.btn_tagbulk, self.btn_readme):
+        for b in (self.btn_search, self.btn_add, self.btn_edit, self.btn_del, self.btn_tagbulk,
+                  self.btn_import, self.btn_export, self.btn_passwd, self.btn_readme):
             b.setMinimumWidth(86)
         row.addWidget(self.edit_search, 1)
         row.addWidget(self.combo_tag)
@@ -424,6 +593,9 @@ class MainWindow(QWidget):
         row.addWidget(self.btn_edit)
         row.addWidget(self.btn_del)
         row.addWidget(self.btn_tagbulk)
+        row.addWidget(self.btn_import)
+        row.addWidget(self.btn_export)
+        row.addWidget(self.btn_passwd)
         row.addWidget(self.btn_readme)
         main.addLayout(row)
 
@@ -447,6 +619,8 @@ class MainWindow(QWidget):
         self.tree.setColumnWidth(2, 320)
         self.tree.setColumnWidth(3, 160)
         main.addWidget(self.tree, 1)
+        self._group_items = {}; self._group_keys = []; self._paging = False
+        self._page_order = "desc"; self._page_after = None
 
         # シグナル
         self.btn_search.clicked.connect(self.update_list)
@@ -454,21 +628,42 @@ class MainWindow(QWidget):
         self.btn_edit.clicked.connect(self._edit_selected)
         self.btn_del.clicked.connect(self._delete_selected)
         self.btn_tagbulk.clicked.connect(self._bulk_edit_tags)
+        self.btn_import.clicked.connect(self._import_file)
+        self.btn_export.clicked.connect(self._export_file)
+        self.btn_passwd.clicked.connect(self._change_password)
         self.btn_readme.clicked.connect(self._show_readme)
         self.tree.itemDoubleClicked.connect(self._on_double_click)
         self.edit_search.returnPressed.connect(self.update_list)
         self.combo_sort.currentIndexChanged.connect(self._on_sort_changed)
+        self.tree.verticalScrollBar().valueChanged.connect(self._on_tree_scrolled)
+
+        # ファビコン（別スレッドで取り、届いた順に行へ反映）
+        self.icons = IconLoader(self, store=FaviconStore(f=self.f if ICON_STORE_ENCRYPT else None))
+        self.icons.iconReady.connect(self._on_icon_ready)
+        self._icon_waiting = {}
+        self._icon_placeholder = self.style().standardIcon(QStyle.SP_DriveNetIcon)
 
-        # 初期ロード
+        # 初期ロード（先に1ページ目を描画し、タグ一覧は描画後に）
         self._load_sort_option()
-        self._refresh_tag_menu()
+        self.combo_tag.addItem("全て")
         self.update_list()
+        QTimer.singleShot(0, self._refresh_tag_menu)
 
         # クリップボード監視
         self._last_clip = ""
+        self._clip_dialog_open = False
+        self.titles = TitleLoader(self)
+        self.titles.titleReady.connect(self._on_title_ready)
+        self._title_pending: dict[str, dict[int, bool]] = {}  # URL → 仮のタイトルで保存した id → マージしたか
         self.clip_timer = QTimer(self); self.clip_timer.timeout.connect(self._check_clipboard)
         self.clip_timer.start(1000)
 
+        # 自動バックアップ（別スレッドで少しずつ写す。前回から変更が無ければ取らない）
+        self.backup = BackupScheduler()
+        self.backup_timer = QTimer(self); self.backup_timer.timeout.connect(self._run_backup)
+        if BACKUP_INTERVAL_MIN > 0:
+            self.backup_timer.start(BACKUP_INTERVAL_MIN * 60_000)
+
         # フレームレス移動/リサイズ
         self._moving = False; self._drag_offset = QPoint()
         self._resizing = False; self._resize_edges = ""; self._start_geo = None; self._start_mouse = None
@@ -481,7 +676,7 @@ class MainWindow(QWidget):
     def _password_flow(self):
         from PySide6.QtWidgets import QInputDialog
         global FERNET
-        if not os.path.exists(DB_FILE):
+        if is_new_vault():
             while True:
                 pw1, ok1 = QInputDialog.getText(self, "新規パスワード設定", "新しいパスワード:", QLineEdit.Password)
                 if not ok1 or not pw1: sys.exit(0)
@@ -491,16 +686,89 @@ class MainWindow(QWidget):
                     QMessageBox.warning(self, "不一致", "パスワードが一致しないよ。")
                     continue
                 QMessageBox.information(self, "設定完了", "パスワードを設定したよ。忘れないでね！")
-                self.f = get_fernet(pw1); FERNET = self.f; break
+                self.f = create_vault_key(pw1); FERNET = self.f
+                write_key_check(self.f)
+                break
         else:
-            pw, ok = QInputDialog.getText(self, "パスワード入力", "パスワード:", QLineEdit.Password)
-            if not ok or not pw: sys.exit(0)
-            self.f = get_fernet(pw); FERNET = self.f
+            while True:
+                pw, ok = QInputDialog.getText(self, "パスワード入力", "パスワード:", QLineEdit.Password)
+                if not ok or not pw: sys.exit(0)
+                f = get_fernet(pw)
+                if check_password(f):
+                    if needs_kdf_upgrade():
+                        # 旧方式の鍵 → KDF の鍵へ一度だけ付け替える
+                        dlg, progress = self._make_progress("鍵を更新中…")
+                        try:
+                            f = upgrade_kdf(pw, f, progress=progress)
+                        finally:
+                            dlg.close()
+                    self.f = f; FERNET = self.f
+                    break
+                QMessageBox.warning(self, "パスワード違い", "パスワードが違うみたい。もう一度入力してね。")
+
+    # ===== 進捗表示（長い処理用） =====
+    def _make_progress(self, label: str):
+        """(ダイアログ, progress(done, total) コールバック) を返す。短い処理なら表示されない。"""
+        from PySide6.QtWidgets import QProgressDialog, QApplication
+        dlg = QProgressDialog(label, "", 0, 0, self)
+        dlg.setWindowTitle(f"{APP_TITLE} {TITLE_SUFFIX}")
+        dlg.setCancelButton(None)
+        dlg.setWindowModality(Qt.WindowModal)
+        dlg.setMinimumDuration(400)
+        def _progress(done: int, total: int):
+            if total < 0:
+                # 総数が分からない処理は件数だけ出す
+                dlg.setMaximum(0); dlg.setLabelText(f"{label}（{done} 件）")
+            else:
+                dlg.setMaximum(max(total, 1)); dlg.setValue(min(done, max(total, 1)))
+            QApplication.processEvents()
+        return dlg, _progress
+
+    # ===== url_hash の移行（重複は報告だけして起動は続ける） =====
+    def _migrate_url_hash(self):
+        dlg, progress = self._make_progress("URLハッシュを更新中…")
+        try:
+            report = migrate_populate_url_hash(self.f, progress=progress)
+        finally:
+            dlg.close()
+        unreadable = report.get("unreadable") or []
+        if unreadable:
+            QMessageBox.warning(self, "読めないブックマーク",
+                                f"復号できないブックマークが {len(unreadable)} 件あるよ（重複チェックの対象外）。\n"
+                                f"id: {', '.join(str(i) for i in unreadable[:20])}" + (" …" if len(unreadable) > 20 else ""))
+        dups = report["duplicates"]
+        if not dups:
+            return
+        lines = []
+        for ids in dups[:10]:
+            bms = get_bookmarks_by_ids(ids, self.f)
+            title = bms[0].title if bms else "?"
+            lines.append(f"・{title}（id: {', '.join(str(i) for i in ids)}）")
+        if len(dups) > 10:
+            lines.append(f"…ほか {len(dups) - 10} 組")
+        QMessageBox.warning(self, "重複URL",
+                            f"同じURLのブックマークが {len(dups)} 組あるよ。\n"
+                            "整理するまで重複チェックの索引は一時的に通常索引で動くよ。\n\n" + "\n".join(lines))
+
+    # ===== タグをタグ辞書（tags / bookmark_tag）へ移す =====
+    def _migrate_tags(self):
+        dlg, progress = self._make_progress("タグを整理中…")
+        try:
+            migrate_tags_to_table(self.f, progress=progress)
+        finally:
+            dlg.close()
+
+    # ===== キーワード検索の索引（有効なときだけ。作りかけは続きから） =====
+    def _build_search_index(self):
+        dlg, progress = self._make_progress("検索の索引を作成中…")
+        try:
+            ensure_search_index(self.f, progress=progress)
+        finally:
+            dlg.close()
 
     # ===== 位置・サイズ保存/復元 =====
     def _restore_geometry(self):
-        st = load_settings_json()
-        g = st.get("window_geometry") or {}
+        g = self.settings.get("window_geometry") or {}
         try:
             x, y = int(g.get("x", 0)), int(g.get("y", 0))
             w, h = int(g.get("w", 0)), int(g.get("h", 0))
@@ -514,9 +782,7 @@ class MainWindow(QWidget):
     def _save_geometry(self):
         try:
             g = {"x": self.x(), "y": self.y(), "w": self.width(), "h": self.height()}
-            st = load_settings_json()
-            st["window_geometry"] = g
-            save_settings_json(st)
+            self.settings.set("window_geometry", g)
         except Exception:
             pass
 
@@ -531,24 +797,25 @@ class MainWindow(QWidget):
     # ===== タグ・リスト =====
     def _refresh_tag_menu(self):
         tags = collect_all_tags(self.f)
+        cur = self.combo_tag.currentText()
         self.combo_tag.clear(); self.combo_tag.addItem("全て")
         for t in sorted(tags):
             if t: self.combo_tag.addItem(t)
+        # 選んでいたタグが残っていれば選び直す
+        i = self.combo_tag.findText(cur)
+        if i > 0: self.combo_tag.setCurrentIndex(i)
 
     # ===== 並びオプションの保存/読込 =====
     def _load_sort_option(self):
-        st = load_settings_json()
-        idx = int(st.get("sort_option", SORT_NEW_TO_OLD))
+        idx = int(self.settings.get("sort_option", SORT_NEW_TO_OLD))
         if idx < 0 or idx > 3: idx = SORT_NEW_TO_OLD
         self.combo_sort.blockSignals(True)
         self.combo_sort.setCurrentIndex(idx)
         self.combo_sort.blockSignals(False)
 
     def _on_sort_changed(self, _=None):
-        # 保存して即反映
-        st = load_settings_json()
-        st["sort_option"] = self.combo_sort.currentIndex()
-        save_settings_json(st)
+        # 反映は即、保存はタイマーでまとめて
+        self.settings.set("sort_option", self.combo_sort.currentIndex())
         self.update_list()
 
     # ===== リストの更新（検索 + 並び替え + グルーピング） =====
@@ -556,55 +823,157 @@ class MainWindow(QWidget):
         keyword = (self.edit_search.text() or "").strip().lower()
         tag_kw  = self.combo_tag.currentText()
         sort_idx = self.combo_sort.currentIndex()
-        self.tree.clear()
+        self._clear_tree()
 
-        items = get_all_bookmarks(self.f)
         terms = keyword.split() if keyword else []
 
-        # フィルタ
+        # タグ絞り込み（完全一致・AND）はインデックスで引く: コンボ + 検索語の「#タグ」
+        tag_filter = [] if tag_kw in ("全て", "") else [tag_kw]
+        tag_filter += [t[1:] for t in terms if t.startswith("#") and len(t) > 1]
+        terms = [t for t in terms if not (t.startswith("#") and len(t) > 1)]
+
+        # 絞り込み無しの追加順で、まだ全件を復号していなければページ読み（見える分だけ復号）
+        if (not tag_filter and not terms and sort_idx in (SORT_NEW_TO_OLD, SORT_OLD_TO_NEW)
+                and not bookmarks_cached(self.f)):
+            self._page_order = "desc" if sort_idx == SORT_NEW_TO_OLD else "asc"
+            self._page_after = 0 if self._page_order == "asc" else None
+            self._paging = True
+            self._load_next_page()
+            return
+
+        # 候補id: タグ索引 ∩ キーワード索引（有効時）。どちらも無ければ全件
+        ids = find_ids_by_tags(tag_filter, self.f) if tag_filter else None
+        kw_ids = find_ids_by_keywords(terms, self.f) if terms else None
+        if kw_ids is not None:
+            ids = kw_ids if ids is None else sorted(set(ids) & set(kw_ids))
+        items = get_bookmarks_by_ids(ids, self.f) if ids is not None else get_all_bookmarks(self.f)
+
+        # フィルタ（索引は候補の絞り込みだけなので、部分一致はここで確認する）
         filtered = []
         for bm in items:
-            tag_ok = (tag_kw == "全て") or (tag_kw.lower() in (bm["tags"] or "").lower())
-            if not tag_ok: continue
             if terms:
-                joined = f'{bm["title"]} {bm["url"]} {bm["domain"]} {bm["tags"]}'.lower()
+                joined = search_text(bm.domain, bm.title, bm.url, bm.tags_str)
                 if not all(t in joined for t in terms): continue
             filtered.append(bm)
 
         # 並び替え
         if sort_idx == SORT_NEW_TO_OLD:
             # 追加順（新→旧）: id の降順
-            filtered.sort(key=lambda x: x["id"], reverse=True)
+            filtered.sort(key=lambda x: x.id, reverse=True)
         elif sort_idx == SORT_OLD_TO_NEW:
             # 追加順（旧→新）: id の昇順
-            filtered.sort(key=lambda x: x["id"])
+            filtered.sort(key=lambda x: x.id)
         elif sort_idx == SORT_TITLE_ASC:
-            filtered.sort(key=lambda x: natural_key(x["title"]))
+            filtered.sort(key=lambda x: natural_key(x.title))
         else:  # SORT_TITLE_DESC
-            filtered.sort(key=lambda x: natural_key(x["title"]), reverse=True)
-
-        # グループ化
-        groups = {}
-        for bm in filtered:
-            g = bm.get("group") or bm["domain"]
-            groups.setdefault(g, []).append(bm)
-
-        # ツリーへ反映
-        for g in sorted(groups.keys()):
-            parent = QTreeWidgetItem([g, "", "", ""])
-            parent.setData(0, Qt.UserRole, None)
-            font = parent.font(0); font.setBold(True); parent.setFont(0, font)
-            self.tree.addTopLevelItem(parent)
-            for bm in groups[g]:
-                child = QTreeWidgetItem(["", bm["title"], bm["url"], bm["tags"]])
-                child.setData(0, Qt.UserRole, bm)
-                child.setToolTip(1, bm["title"])
-                child.setToolTip(2, bm["url"])
-                child.setToolTip(3, bm["tags"])
-                icon = get_site_icon(bm["url"])
-                if icon: child.setIcon(1, icon)
-                parent.addChild(child)
-            parent.setExpanded(True)
+            filtered.sort(key=lambda x: natural_key(x.title), reverse=True)
+
+        self._append_to_tree(filtered)
+
+    # ===== ツリー構築（グループ = 分類ごとの親項目。分類名の昇順に差し込む） =====
+    def _clear_tree(self):
+        self.tree.clear()
+        self._icon_waiting = {}
+        self._group_items = {}
+        self._group_keys = []
+        self._paging = False
+
+    def _append_to_tree(self, bms):
+        for bm in bms:
+            g = bm.group or bm.domain
+            parent = self._group_items.get(g)
+            if parent is None:
+                parent = QTreeWidgetItem([g, "", "", ""])
+                parent.setData(0, Qt.UserRole, None)
+                font = parent.font(0); font.setBold(True); parent.setFont(0, font)
+                pos = bisect.bisect(self._group_keys, g)
+                self._group_keys.insert(pos, g)
+                self.tree.insertTopLevelItem(pos, parent)
+                parent.setExpanded(True)
+                self._group_items[g] = parent
+            child = QTreeWidgetItem(["", bm.title, bm.url, bm.tags_str])
+            child.setData(0, Qt.UserRole, bm)
+            child.setToolTip(1, bm.title)
+            child.setToolTip(2, bm.url)
+            child.setToolTip(3, bm.tags_str)
+            # ファビコンは後から届く（届くまでは仮のアイコン）
+            icon = self.icons.icon(bm.domain, bm.url)
+            child.setIcon(1, icon or self._icon_placeholder)
+            if self.icons.pending(bm.domain):
+                self._icon_waiting.setdefault(bm.domain, []).append(child)
+            parent.addChild(child)
+
+    def _on_icon_ready(self, domain: str, icon):
+        items = self._icon_waiting.pop(domain, ())
+        if icon is None:
+            return
+        for child in items:
+            try:
+                child.setIcon(1, icon)
+            except RuntimeError:
+                pass  # その行は消された
+
+    def _tree_children(self):
+        for i in range(self.tree.topLevelItemCount()):
+            parent = self.tree.topLevelItem(i)
+            for j in range(parent.childCount()):
+                yield parent.child(j)
+
+    def _is_filtered(self) -> bool:
+        return bool((self.edit_search.text() or "").strip()) or self.combo_tag.currentText() not in ("全て", "")
+
+    def _patch_tree(self, bms):
+        """一括処理で変わった行だけ差し替える（絞り込み中は該当の有無が変わるので作り直す）。"""
+        if not bms:
+            return
+        if self._is_filtered():
+            self.update_list()
+            return
+        by_id = {bm.id: bm for bm in bms}
+        for child in self._tree_children():
+            old = child.data(0, Qt.UserRole)
+            bm = by_id.get(old.id) if old else None
+            if bm is None:
+                continue
+            child.setData(0, Qt.UserRole, bm)
+            child.setText(1, bm.title); child.setToolTip(1, bm.title)
+            child.setText(2, bm.url);   child.setToolTip(2, bm.url)
+            child.setText(3, bm.tags_str); child.setToolTip(3, bm.tags_str)
+
+    def _remove_from_tree(self, ids):
+        ids = set(ids)
+        for child in list(self._tree_children()):
+            bm = child.data(0, Qt.UserRole)
+            if not bm or bm.id not in ids:
+                continue
+            parent = child.parent()
+            parent.removeChild(child)
+            if parent.childCount() == 0:
+                g = parent.text(0)
+                self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(parent))
+                self._group_items.pop(g, None)
+                self._group_keys.remove(g)
+
+    # ===== ページ読み（スクロールで下端に近づいたら次のページ） =====
+    def _load_next_page(self):
+        if not self._paging:
+            return
+        page = get_bookmarks_page(self.f, limit=LIST_PAGE_SIZE, order=self._page_order, after_id=self._page_after)
+        if not page:
+            self._paging = False
+            return
+        self._page_after = page[-1].id
+        self._append_to_tree(page)
+        if len(page) < LIST_PAGE_SIZE:
+            self._paging = False
+        elif self.tree.isVisible() and self.tree.verticalScrollBar().maximum() == 0:
+            # まだ画面が埋まらない → もう1ページ
+            QTimer.singleShot(0, self._load_next_page)
+
+    def _on_tree_scrolled(self, value: int):
+        sb = self.tree.verticalScrollBar()
+        if self._paging and value >= sb.maximum() - sb.pageStep():
+            self._load_next_page()
 
     # ====== 共通：タグ結合ロジック ======
     @staticmethod
@@ -637,7 +1006,7 @@ class MainWindow(QWidget):
 
     # ====== 追加/編集で使う重複処理 ======
     def _handle_duplicate_flow(self, new_domain, new_title, new_url, new_tags, new_group):
-        h = compute_url_hash(new_url)
+        h = compute_url_hash(new_url, normalized=True)
         exist = find_bookmark_by_urlhash(h, self.f)
         if not exist:
             return ("none", None)
@@ -665,33 +1034,47 @@ class MainWindow(QWidget):
         dlg = BulkTagDialog(self)
         if dlg.exec() != QDialog.Accepted:
             return
-        mode = dlg.mode()
-        inputs = dlg.tags_input()
-        count = 0
-        for it in selected_children:
-            bm = it.data(0, Qt.UserRole)
-            if not bm: continue
-            cur_tags = self._parse_tags(bm.get("tags") or "")
-            if mode == "replace":
-                new_tags_list = inputs
-            elif mode == "add":
-                new_tags_list = self._merge_add_case_insensitive(cur_tags, inputs)
-            else:  # remove（区別あり）
-                rm = set(inputs)
-                new_tags_list = [t for t in cur_tags if t not in rm]
-            new_tags_str = self._join_unique(new_tags_list)
-            update_bookmark_tags(bm["id"], new_tags_str, self.f)
-            count += 1
+        # add は大文字小文字を無視して足す / remove は表記が完全一致するものを外す / replace は置き換え
+        ids = [bm.id for bm in (it.data(0, Qt.UserRole) for it in selected_children) if bm]
+        changed = update_tags_bulk(ids, dlg.mode(), dlg.tags_input(), self.f)
         self._refresh_tag_menu()
-        self.update_list()
-        QMessageBox.information(self, "完了", f"{count} 件のタグを更新したよ。")
+        self._patch_tree(changed)
+        QMessageBox.information(self, "完了", f"{len(changed)} 件のタグを更新したよ。")
+
+    # ===== タイトルの後追い =====
+    def _title_or_url(self, url: str) -> str:
+        """取ってあるタイトル。無ければ取りに行き始めて URL を仮のタイトルにする（保存を待たせない）。"""
+        return self.titles.title(url) or url
+
+    def _title_later(self, bm_id: int, url: str, title: str, *, merge: bool = False):
+        """
+        仮のタイトル（URL）で保存した行は、タイトルが届いたら書き換える。
+        merge=True（マージで既存のタイトルを残した行）は、届いたタイトルの方が長いときだけ書き換える。
+        """
+        if title != url:
+            return
+        self._title_pending.setdefault(url, {})[bm_id] = merge
+        fetched = self.titles.title(url)  # 重複確認のダイアログを出している間に届いていたら今すぐ
+        if fetched is not None:
+            self._on_title_ready(url, fetched)
+
+    def _on_title_ready(self, url: str, title: str):
+        ids = self._title_pending.pop(url, None)
+        if not ids or title == url:
+            return
+        # その間に手で直された行はそのまま。マージした行は長い方のタイトルを残す（保存時と同じ決め方）
+        bms = [bm for bm in get_bookmarks_by_ids(sorted(ids), self.f)
+               if bm.title == url or (ids[bm.id] and len(title) > len(bm.title))]
+        for bm in bms:
+            update_bookmark_full(bm.id, bm.domain, title, bm.url, bm.tags_str, bm.group, self.f)
+        self._patch_tree(get_bookmarks_by_ids([bm.id for bm in bms], self.f))
 
     # ===== CRUD =====
     def _manual_add(self):
         dlg = BookmarkEditDialog(self, is_new=True)
         if dlg.exec() == QDialog.Accepted:
             url   = normalize_url(dlg.ed_url.text().strip())
-            title = dlg.ed_title.text().strip() or get_page_title(url)
+            title = dlg.ed_title.text().strip() or self._title_or_url(url)
             tags  = dlg.ed_tags.text().strip()
             domain = extract_domain(url)
             group  = domain
@@ -699,19 +1082,22 @@ class MainWindow(QWidget):
             if action == "skip":
                 return
             elif action == "merge":
-                cur = self._parse_tags(exist["tags"]); put = self._parse_tags(tags)
+                cur = self._parse_tags(exist.tags_str); put = self._parse_tags(tags)
                 merged_tags = self._merge_add_case_insensitive(cur, put)
                 tags = self._join_unique(merged_tags)
-                if len(title) > len(exist["title"]):
-                    update_bookmark_full(exist["id"], domain, title, url, tags, group, self.f)
+                if title != url and len(title) > len(exist.title):  # 取得待ちの URL で既存のタイトルを潰さない
+                    update_bookmark_full(exist.id, domain, title, url, tags, group, self.f)
                 else:
-                    update_bookmark_full(exist["id"], exist["domain"], exist["title"], url, tags, exist["group"] or group, self.f)
+                    update_bookmark_full(exist.id, exist.domain, exist.title, url, tags, exist.group or group, self.f)
+                self._title_later(exist.id, url, title, merge=True)
                 self._refresh_tag_menu(); self.update_list()
             elif action == "overwrite":
-                update_bookmark_full(exist["id"], domain, title, url, tags, group, self.f)
+                update_bookmark_full(exist.id, domain, title, url, tags, group, self.f)
+                self._title_later(exist.id, url, title)
                 self._refresh_tag_menu(); self.update_list()
             else:
-                add_bookmark_to_db(domain, title, url, tags or "", group, self.f)
+                bm_id = add_bookmark_to_db(domain, title, url, tags or "", group, self.f)
+                self._title_later(bm_id, url, title)
                 self._refresh_tag_menu(); self.update_list()
 
     def _edit_selected(self):
@@ -721,17 +1107,17 @@ class MainWindow(QWidget):
             return
         bm = item.data(0, Qt.UserRole)
         if not bm: return
-        dlg = BookmarkEditDialog(self, title=bm["title"], url=bm["url"], tags=bm["tags"], is_new=False)
+        dlg = BookmarkEditDialog(self, title=bm.title, url=bm.url, tags=bm.tags_str, is_new=False)
         if dlg.exec() == QDialog.Accepted:
             new_url   = normalize_url(dlg.ed_url.text().strip())
-            new_title = dlg.ed_title.text().strip() or get_page_title(new_url)
+            new_title = dlg.ed_title.text().strip() or self._title_or_url(new_url)
             new_tags  = dlg.ed_tags.text().strip()
             new_domain = extract_domain(new_url)
             new_group  = new_domain
 
-            h = compute_url_hash(new_url)
+            h = compute_url_hash(new_url, normalized=True)
             exist = find_bookmark_by_urlhash(h, self.f)
-            if exist and exist["id"] != bm["id"]:
+            if exist and exist.id != bm.id:
                 msg = QMessageBox(self)
                 msg.setWindowTitle("重複URLを検出")
                 msg.setIcon(QMessageBox.Question)
@@ -741,58 +1127,168 @@ class MainWindow(QWidget):
                 btn_cancel = msg.addButton("キャンセル", QMessageBox.RejectRole)
                 msg.exec()
                 if msg.clickedButton() is btn_merge:
-                    cur = self._parse_tags(exist["tags"]); put = self._parse_tags(new_tags)
+                    cur = self._parse_tags(exist.tags_str); put = self._parse_tags(new_tags)
                     merged_tags = self._merge_add_case_insensitive(cur, put)
                     new_tags = self._join_unique(merged_tags)
-                    if len(new_title) > len(exist["title"]):
-                        update_bookmark_full(exist["id"], new_domain, new_title, new_url, new_tags, new_group, self.f)
+                    if new_title != new_url and len(new_title) > len(exist.title):  # 取得待ちの URL で既存のタイトルを潰さない
+                        update_bookmark_full(exist.id, new_domain, new_title, new_url, new_tags, new_group, self.f)
                     else:
-                        update_bookmark_full(exist["id"], exist["domain"], exist["title"], new_url, new_tags, exist["group"] or new_group, self.f)
-                    delete_bookmark_by_id(bm["id"])
+                        update_bookmark_full(exist.id, exist.domain, exist.title, new_url, new_tags, exist.group or new_group, self.f)
+                    delete_bookmark_by_id(bm.id)
+                    self._title_later(exist.id, new_url, new_title, merge=True)
                     self._refresh_tag_menu(); self.update_list()
                     return
                 elif msg.clickedButton() is btn_over:
-                    update_bookmark_full(exist["id"], new_domain, new_title, new_url, new_tags, new_group, self.f)
-                    delete_bookmark_by_id(bm["id"])
+                    update_bookmark_full(exist.id, new_domain, new_title, new_url, new_tags, new_group, self.f)
+                    delete_bookmark_by_id(bm.id)
+                    self._title_later(exist.id, new_url, new_title)
                     self._refresh_tag_menu(); self.update_list()
                     return
                 else:
                     return
-            update_bookmark_full(bm["id"], new_domain, new_title, new_url, new_tags, new_group, self.f)
+            update_bookmark_full(bm.id, new_domain, new_title, new_url, new_tags, new_group, self.f)
+            self._title_later(bm.id, new_url, new_title)
             self._refresh_tag_menu(); self.update_list()
 
     def _delete_selected(self):
-        item = self.tree.currentItem()
-        if not item or not item.parent():
-            QMessageBox.information(self, "未選択", "削除するブックマーク（子項目）を選んでね。")
+        ids = [bm.id for bm in (it.data(0, Qt.UserRole) for it in self.tree.selectedItems() if it.parent()) if bm]
+        if not ids:
+            QMessageBox.information(self, "未選択", "削除するブックマーク（子項目、複数可）を選んでね。")
             return
-        bm = item.data(0, Qt.UserRole)
-        if not bm: return
-        if QMessageBox.question(self, "確認", "本当に削除する？") == QMessageBox.Yes:
-            delete_bookmark_by_id(bm["id"])
-            self._refresh_tag_menu(); self.update_list()
+        text = "本当に削除する？" if len(ids) == 1 else f"{len(ids)} 件を本当に削除する？"
+        if QMessageBox.question(self, "確認", text) == QMessageBox.Yes:
+            deleted = delete_bookmarks_bulk(ids)
+            self._refresh_tag_menu(); self._remove_from_tree(deleted)
 
     # ===== 動作 =====
     def _on_double_click(self, item, col):
         bm = item.data(0, Qt.UserRole)
-        if bm and is_url(bm["url"]): webbrowser.open(bm["url"])
+        if bm and is_url(bm.url): webbrowser.open(bm.url)
 
     def _show_readme(self):
         ReadmeDialog(self).exec()
 
+    # ===== 取り込み（ブラウザのエクスポート） =====
+    def _import_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "ブックマークを取り込む", "",
+                                              "ブックマーク (*.html *.htm *.json);;すべて (*)")
+        if not path:
+            return
+        try:
+            fmt = detect_format(path)
+        except ValueError as e:
+            QMessageBox.warning(self, "取り込み", str(e))
+            return
+        # 重複URLの扱いはファイル全体で1つ（手動追加と同じ3択）
+        msg = QMessageBox(self)
+        msg.setWindowTitle("重複URLの扱い")
+        msg.setIcon(QMessageBox.Question)
+        msg.setText("既に登録済みのURLがあったらどうする？\n（ファイル内の全部に同じ扱いをするよ）")
+        btn_merge = msg.addButton("マージ", QMessageBox.AcceptRole)
+        btn_over  = msg.addButton("上書き", QMessageBox.DestructiveRole)
+        msg.addButton("スキップ", QMessageBox.RejectRole)
+        msg.exec()
+        policy = "merge" if msg.clickedButton() is btn_merge else "overwrite" if msg.clickedButton() is btn_over else "skip"
+        dlg, progress = self._make_progress("取り込み中…")
+        try:
+            st = import_bookmarks(path, self.f, policy=policy, fmt=fmt, progress=progress)
+        finally:
+            dlg.close()
+        self._refresh_tag_menu(); self.update_list()
+        QMessageBox.information(self, "取り込み",
+                                f"追加 {st['added']} 件 / マージ {st['merged']} 件 / 上書き {st['overwritten']} 件 / 変更なし {st['unchanged']} 件 / "
+                                f"スキップ {st['skipped']} 件 / 対象外 {st['invalid']} 件")
+
+    # ===== 書き出し（バックアップ・移行用） =====
+    def _export_file(self):
+        from PySide6.QtWidgets import QInputDialog
+        filters = {"ブックマークHTML (*.html)": "html", "JSON Lines (*.jsonl)": "jsonl", "CSV (*.csv)": "csv"}
+        path, flt = QFileDialog.getSaveFileName(self, "ブックマークを書き出す", "bookmarks.html", ";;".join(filters))
+        if not path:
+            return
+        fmt = filters.get(flt) or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in filters.values():
+            fmt = "html"
+        pw, ok = QInputDialog.getText(self, "書き出しの暗号化",
+                                      "暗号化するパスフレーズ（空欄なら暗号化しない）:", QLineEdit.Password)
+        if not ok:
+            return
+        if pw and not path.endswith(".enc"):
+            path += ".enc"
+        dlg, progress = self._make_progress("書き出し中…")
+        t0 = time.perf_counter()
+        def _progress(done, total):
+            dlg.setLabelText(f"書き出し中…（{done / max(time.perf_counter() - t0, 1e-6):.0f} 件/秒）")
+            progress(done, total)
+        try:
+            st = export_bookmarks(path, self.f, fmt=fmt, passphrase=pw or None, progress=_progress)
+        finally:
+            dlg.close()
+        QMessageBox.information(self, "書き出し",
+                                f"{st['rows']} 件を書き出したよ（{st['seconds']:.1f} 秒 / {st['rows_per_sec']:.0f} 件/秒）\n{path}")
+
+    # ===== パスワード変更 =====
+    def _change_password(self):
+        from PySide6.QtWidgets import QInputDialog
+        global FERNET
+        pw, ok = QInputDialog.getText(self, "パスワード変更", "今のパスワード:", QLineEdit.Password)
+        if not ok or not pw:
+            return
+        old_f = get_fernet(pw)
+        if not check_password(old_f):
+            QMessageBox.warning(self, "パスワード違い", "今のパスワードが違うみたい。")
+            return
+        while True:
+            pw1, ok1 = QInputDialog.getText(self, "パスワード変更", "新しいパスワード:", QLineEdit.Password)
+            if not ok1 or not pw1: return
+            pw2, ok2 = QInputDialog.getText(self, "確認", "もう一度入力:", QLineEdit.Password)
+            if not ok2 or not pw2: return
+            if pw1 == pw2:
+                break
+            QMessageBox.warning(self, "不一致", "パスワードが一致しないよ。")
+        dlg, progress = self._make_progress("暗号化し直しています…")
+        try:
+            new_f = change_password(old_f, pw1, progress=progress)
+        except RuntimeError as e:
+            QMessageBox.warning(self, "パスワード変更", f"{e}\nパスワードは変わっていないよ。もう一度試してね。")
+            return
+        finally:
+            dlg.close()
+        self.f = new_f; FERNET = self.f
+        if ICON_STORE_ENCRYPT:
+            self.icons.store.set_key(self.f)
+        self._refresh_tag_menu(); self.update_list()
+        QMessageBox.information(self, "パスワード変更", "パスワードを変更したよ。忘れないでね！")
+
+    # ===== 自動バックアップ =====
+    def _run_backup(self):
+        # 前回の失敗はここで知らせる（バックアップのスレッドからは UI に触れないため）
+        res = self.backup.result
+        if res and res[1] is not None:
+            self.backup.result = None
+            QMessageBox.warning(self, "バックアップ", f"前回のバックアップに失敗したよ。\n{res[1]}")
+        self.backup.start()
+
     # ===== クリップボード監視 =====
     def _check_clipboard(self):
         from PySide6.QtGui import QGuiApplication
         text = (QGuiApplication.clipboard().text() or "").strip()
         if text == self._last_clip: return
         self._last_clip = text
+        if self._clip_dialog_open: return  # 追加ダイアログを開いている間のコピーは拾わない（ダイアログが重なるため）
         if is_url(text):
             nurl  = normalize_url(text)
-            title = get_page_title(nurl)
-            dlg = BookmarkEditDialog(self, is_new=True, title=title, url=nurl, tags="")
-            if dlg.exec() == QDialog.Accepted:
+            # タイトルは裏で取る（同じ URL を何度コピーしても取りに行くのは1回）
+            dlg = BookmarkEditDialog(self, is_new=True, title="", url=nurl, tags="")
+            dlg.fetch_title(self.titles)
+            self._clip_dialog_open = True
+            try:
+                accepted = dlg.exec() == QDialog.Accepted
+            finally:
+                self._clip_dialog_open = False
+            if accepted:
                 url   = normalize_url(dlg.ed_url.text().strip())
-                title = dlg.ed_title.text().strip() or get_page_title(url)
+                title = dlg.ed_title.text().strip() or self._title_or_url(url)
                 tags  = dlg.ed_tags.text().strip()
                 domain = extract_domain(url)
                 group  = domain
@@ -800,19 +1296,22 @@ class MainWindow(QWidget):
                 if action == "skip":
                     return
                 elif action == "merge":
-                    cur = self._parse_tags(exist["tags"]); put = self._parse_tags(tags)
+                    cur = self._parse_tags(exist.tags_str); put = self._parse_tags(tags)
                     merged_tags = self._merge_add_case_insensitive(cur, put)
                     tags = self._join_unique(merged_tags)
-                    if len(title) > len(exist["title"]):
-                        update_bookmark_full(exist["id"], domain, title, url, tags, group, self.f)
+                    if title != url and len(title) > len(exist.title):  # 取得待ちの URL で既存のタイトルを潰さない
+                        update_bookmark_full(exist.id, domain, title, url, tags, group, self.f)
                     else:
-                        update_bookmark_full(exist["id"], exist["domain"], exist["title"], url, tags, exist["group"] or group, self.f)
+                        update_bookmark_full(exist.id, exist.domain, exist.title, url, tags, exist.group or group, self.f)
+                    self._title_later(exist.id, url, title, merge=True)
                     self._refresh_tag_menu(); self.update_list()
                 elif action == "overwrite":
-                    update_bookmark_full(exist["id"], domain, title, url, tags, group, self.f)
+                    update_bookmark_full(exist.id, domain, title, url, tags, group, self.f)
+                    self._title_later(exist.id, url, title)
                     self._refresh_tag_menu(); self.update_list()
                 else:
-                    add_bookmark_to_db(domain, title, url, tags or "", group, self.f)
+                    bm_id = add_bookmark_to_db(domain, title, url, tags or "", group, self.f)
+                    self._title_later(bm_id, url, title)
                     self._refresh_tag_menu(); self.update_list()
 
     # ===== フレームレス移動/リサイズ =====
@@ -834,6 +1333,8 @@ class MainWindow(QWidget):
                     self.move(e.globalPosition().toPoint() - self._drag_offset); return True
                 self._update_cursor(self._edge_at(self.mapFromGlobal(e.globalPosition().toPoint())))
             elif e.type() == QEvent.MouseButtonRelease:
+                if self._resizing or self._moving:
+                    self._save_geometry()
                 self._resizing = False; self._moving = False; return True
         return super().eventFilter(obj, e)
 
@@ -868,4 +1369,9 @@ class MainWindow(QWidget):
 
     def closeEvent(self, e):
         self._save_geometry()
+        self.settings_timer.stop(); self.settings.flush()
+        self.icons.shutdown()
+        self.titles.shutdown()
+        self.backup.stop()
+        close_db()
         return super().closeEvent(e)
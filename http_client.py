@@ -0,0 +1,134 @@
+"""
+タイトル・ファビコン取得で共有する HTTP クライアント（requests.Session 1つ）。
+  - keep-alive の接続プールを使い回す（同じホストへの続けての取得で TCP/TLS をやり直さない）
+  - ホストごとの同時接続数を HTTP_PER_HOST までに抑える
+  - budget(秒) の中の取得は、合計でその時間を超えない（リトライ・2段階の取得でも待ち時間が積み上がらない）
+  - 恒久的なリダイレクト（301 / 308）の行き先を覚えて、次からは直接取りに行く
+requests は最初に使うときに読み込む。
+"""
+import time, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from config import HTTP_POOL_SIZE, HTTP_PER_HOST, HTTP_REDIRECT_CACHE_SIZE
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+              "AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/124.0.0.0 Safari/537.36")
+
+class HttpClient:
+    def __init__(self, *, pool_size: int = HTTP_POOL_SIZE, per_host: int = HTTP_PER_HOST,
+                 redirect_cache_size: int = HTTP_REDIRECT_CACHE_SIZE):
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.redirect_cache_size = redirect_cache_size
+        self._session = None
+        self._lock = threading.Lock()
+        self._hosts: dict[str, threading.BoundedSemaphore] = {}
+        self._redirects: OrderedDict[str, str] = OrderedDict()
+        self._local = threading.local()  # スレッドごとの締め切り（budget）
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+                s.mount("http://", adapter); s.mount("https://", adapter)
+                s.headers["User-Agent"] = USER_AGENT
+                self._session = s
+            return self._session
+
+    # --- 締め切り ---
+    @contextmanager
+    def budget(self, seconds: float):
+        """この中での取得は合わせて seconds 秒まで（入れ子なら短い方）。"""
+        prev = getattr(self._local, "deadline", None)
+        deadline = time.monotonic() + seconds
+        self._local.deadline = deadline if prev is None else min(prev, deadline)
+        try:
+            yield
+        finally:
+            self._local.deadline = prev
+
+    def remaining(self) -> float | None:
+        """残り時間（budget の外なら None）。"""
+        deadline = getattr(self._local, "deadline", None)
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _timeout(self, timeout):
+        left = self.remaining()
+        if left is None:
+            return timeout
+        if left <= 0:
+            return None
+        if isinstance(timeout, tuple):
+            return tuple(min(t, left) for t in timeout)
+        return min(timeout, left)
+
+    # --- ホストごとの同時接続 ---
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+    # --- リダイレクト ---
+    def resolve(self, url: str) -> str:
+        """覚えている恒久リダイレクトをたどった先の URL。"""
+        with self._lock:
+            for _ in range(10):
+                nxt = self._redirects.get(url)
+                if nxt is None:
+                    break
+                self._redirects.move_to_end(url)
+                url = nxt
+        return url
+
+    def _remember_redirects(self, res):
+        hops = list(res.history) + [res]
+        with self._lock:
+            for hop, nxt in zip(hops, hops[1:]):
+                if hop.status_code in (301, 308):
+                    self._redirects[hop.url] = nxt.url
+                    self._redirects.move_to_end(hop.url)
+            while len(self._redirects) > self.redirect_cache_size:
+                self._redirects.popitem(last=False)
+
+    # --- 取得 ---
+    def get(self, url: str, *, timeout=(3, 6), headers: dict | None = None, stream: bool = False):
+        """
+        GET して Response を返す。締め切りを過ぎている・ホストの空きを待ちきれない・通信エラーなら None。
+        stream=True のときは呼び出し側で res.close() すること（接続がプールに戻る）。
+        ホストごとの枠で抑えるのは応答ヘッダまで（本文の読み込みは枠の外）。
+        """
+        url = self.resolve(url)
+        t = self._timeout(timeout)
+        if t is None:
+            return None
+        slot = self._host_slot(urlsplit(url).netloc.lower())
+        if not slot.acquire(timeout=max(t) if isinstance(t, tuple) else t):
+            return None
+        try:
+            t = self._timeout(timeout)  # 空きを待った分を引く
+            if t is None:
+                return None
+            res = self.session.get(url, headers=headers, timeout=t, allow_redirects=True, stream=stream)
+        except Exception:
+            return None
+        finally:
+            slot.release()
+        if res.history:
+            self._remember_redirects(res)
+        return res
+
+_CLIENT: HttpClient | None = None
+
+def get_client() -> HttpClient:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = HttpClient()
+    return _CLIENT
@@ -0,0 +1,210 @@
+"""
+ブラウザのブックマークの取り込み（Netscape HTML / Chrome JSON / Firefox JSON）。
+  - ファイルは少しずつ読んで (title, url, tags) を1件ずつ流す
+  - batch_size 件ごとに 正規化・url_hash → 既存との突き合わせ（url_hash の IN 1回）→ 1トランザクションで書き込み
+  - 既に登録済みのURLは policy（merge / overwrite / skip。手動追加の重複処理と同じ意味）でまとめて処理する
+"""
+import re, json
+from html.parser import HTMLParser
+from itertools import islice
+from cryptography.fernet import Fernet
+from utils import is_url, extract_domain, normalize_urls
+from processor import (
+    get_db, compute_url_hash, find_ids_by_urlhashes, get_bookmarks_by_ids,
+    add_bookmarks_bulk, update_bookmarks_bulk
+)
+
+POLICIES = ("merge", "overwrite", "skip")
+_READ_SIZE = 1 << 16
+
+# --- Netscape ブックマーク HTML（Chrome / Firefox / Edge の「HTMLでエクスポート」） ---
+# <DT><H3>フォルダ</H3> <DL><p> ... </DL> の入れ子。<A HREF=... TAGS="a,b">タイトル</A> が1件。
+# ツールバー等の特別なフォルダ（属性で分かる）はタグにしない。
+_CONTAINER_ATTRS = {"personal_toolbar_folder", "unfiled_bookmarks_folder"}
+
+class _NetscapeParser(HTMLParser):
+    def __init__(self, folders_as_tags: bool):
+        super().__init__(convert_charrefs=True)
+        self.folders_as_tags = folders_as_tags
+        self.items = []      # feed() のたびに取り出す
+        self._folders = []   # <DL> の入れ子ごとのフォルダ名（None = タグにしない）
+        self._pending = None # 直前の <H3> の名前（次の <DL> に対応する）
+        self._text = None    # <H3> / <A> の中身を集める
+        self._href = None
+        self._tags = ""
+        self._container = False
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag == "h3":
+            self._text = []
+            self._container = any(k in _CONTAINER_ATTRS for k in a)
+        elif tag == "dl":
+            self._folders.append(self._pending)
+            self._pending = None
+        elif tag == "a":
+            self._text = []
+            self._href = (a.get("href") or "").strip()
+            self._tags = a.get("tags") or ""
+
+    def handle_endtag(self, tag):
+        if tag == "h3" and self._text is not None:
+            self._pending = None if self._container else "".join(self._text).strip() or None
+            self._text = None
+        elif tag == "dl" and self._folders:
+            self._folders.pop()
+        elif tag == "a" and self._href is not None:
+            tags = [t.strip() for t in self._tags.split(",") if t.strip()]
+            if self.folders_as_tags:
+                tags = [d for d in self._folders if d] + tags
+            self.items.append(("".join(self._text or ()).strip(), self._href, tags))
+            self._text = None; self._href = None; self._tags = ""
+
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+def read_netscape_html(fh, *, folders_as_tags: bool = True):
+    """テキストで開いた fh から (title, url, tags) を1件ずつ返す（_READ_SIZE 文字ずつ読む）。"""
+    parser = _NetscapeParser(folders_as_tags)
+    while True:
+        chunk = fh.read(_READ_SIZE)
+        if chunk:
+            parser.feed(chunk)
+        else:
+            parser.close()
+        yield from parser.items
+        parser.items = []
+        if not chunk:
+            return
+
+# --- Chrome（プロファイルの Bookmarks ファイル） / Firefox（「バックアップ」の .json） ---
+# 標準ライブラリに逐次の JSON パーサは無いので、木は一度に読み込み、たどるのをジェネレータにする。
+def _walk_chrome(node, folders, folders_as_tags):
+    if node.get("type") == "url":
+        yield (node.get("name") or "", node.get("url") or "", list(folders) if folders_as_tags else [])
+    for child in node.get("children", ()):
+        yield from _walk_chrome(child, folders + [node.get("name")] if node.get("type") == "folder" else folders,
+                                folders_as_tags)
+
+def read_chrome_json(fh, *, folders_as_tags: bool = True):
+    roots = json.load(fh).get("roots", {})
+    for root in roots.values():
+        if isinstance(root, dict):
+            # bookmark_bar / other / synced 自体の名前はタグにしない
+            for child in root.get("children", ()):
+                yield from _walk_chrome(child, [], folders_as_tags)
+
+def _walk_firefox(node, folders, folders_as_tags):
+    kind = node.get("type")
+    if kind == "text/x-moz-place":
+        tags = [t.strip() for t in (node.get("tags") or "").split(",") if t.strip()]
+        yield (node.get("title") or "", node.get("uri") or "", (list(folders) if folders_as_tags else []) + tags)
+    elif kind == "text/x-moz-place-container":
+        # root を持つもの（メニュー・ツールバー等）は名前をタグにしない
+        sub = folders if node.get("root") else folders + [node.get("title")]
+        for child in node.get("children", ()):
+            yield from _walk_firefox(child, [d for d in sub if d], folders_as_tags)
+
+def read_firefox_json(fh, *, folders_as_tags: bool = True):
+    yield from _walk_firefox(json.load(fh), [], folders_as_tags)
+
+_READERS = {"html": read_netscape_html, "chrome": read_chrome_json, "firefox": read_firefox_json}
+
+def detect_format(path: str) -> str:
+    """先頭を見て "html" / "chrome" / "firefox" を返す。"""
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as fh:
+        head = fh.read(4096)
+    s = head.lstrip()
+    if s.startswith("{"):
+        if '"roots"' in head or '"checksum"' in head:
+            return "chrome"
+        return "firefox"
+    if re.search(r"<!DOCTYPE\s+NETSCAPE-Bookmark-file|<DL", head, re.I):
+        return "html"
+    raise ValueError("対応していない形式のファイルです")
+
+# --- 書き込み ---
+def _merge_tags(current, to_add) -> list[str]:
+    """大文字小文字を無視して、まだ無いものだけ足す（手動追加のマージと同じ）。"""
+    seen = {t.lower() for t in current}
+    out = list(current)
+    for t in to_add:
+        if t.lower() not in seen:
+            seen.add(t.lower()); out.append(t)
+    return out
+
+def _write_batch(batch, f: Fernet, policy: str, stats: dict):
+    # 正規化・ハッシュ。同じバッチ内の同じURLは先のものにまとめる
+    rows = {}
+    valid = [it for it in batch if is_url(it[1])]
+    stats["invalid"] += len(batch) - len(valid)
+    for (title, _, tags), url in zip(valid, normalize_urls(it[1] for it in valid)):
+        h = compute_url_hash(url, normalized=True)
+        if h in rows:
+            if policy == "merge":
+                rows[h][2] = _merge_tags(rows[h][2], tags)
+            stats["skipped"] += 1
+            continue
+        rows[h] = [title.strip() or url, url, list(dict.fromkeys(tags)), extract_domain(url)]
+    exist = find_ids_by_urlhashes(rows)
+    new_hashes = [h for h in rows if h not in exist]
+    new = [(domain, title, url, ", ".join(tags), domain)
+           for title, url, tags, domain in (rows[h] for h in new_hashes)]
+    updates = []; update_hashes = []
+    if exist and policy != "skip":
+        by_id = {bm.id: bm for bm in get_bookmarks_by_ids(list(exist.values()), f)}
+        for h, bm_id in exist.items():
+            bm = by_id.get(bm_id)
+            if bm is None:
+                stats["skipped"] += 1
+                continue
+            title, url, tags, domain = rows[h]
+            if policy == "overwrite":
+                new_tags = tags
+                row = (bm_id, domain, title, url, ", ".join(tags), domain)
+            else:
+                new_tags = _merge_tags(list(bm.tags), tags)
+                if len(title) > len(bm.title):
+                    row = (bm_id, domain, title, url, ", ".join(new_tags), domain)
+                else:
+                    row = (bm_id, bm.domain, bm.title, url, ", ".join(new_tags), bm.group or domain)
+            # 復号済みの中身と同じなら書かない（同じファイルの取り込み直しで全件を暗号化し直さない）
+            if row[1:4] == (bm.domain, bm.title, bm.url) and row[5] == bm.group and list(new_tags) == list(bm.tags):
+                stats["unchanged"] += 1
+                continue
+            update_hashes.append(h)
+            updates.append(row)
+    with get_db().transaction():
+        add_bookmarks_bulk(new, f, hashes=new_hashes)
+        update_bookmarks_bulk(updates, f, hashes=update_hashes)
+    stats["added"] += len(new)
+    stats["merged" if policy == "merge" else "overwritten"] += len(updates)
+    if policy == "skip":
+        stats["skipped"] += len(exist)
+
+def import_bookmarks(path: str, f: Fernet, *, policy: str = "skip", fmt: str | None = None,
+                     folders_as_tags: bool = True, batch_size: int = 2000, progress=None) -> dict:
+    """
+    path のブックマークを取り込む。fmt を省くと detect_format で判定する。
+      - policy: 既に登録済みのURLを "merge"（タグを足し、長い方のタイトル）/ "overwrite" / "skip"
+      - folders_as_tags: フォルダ名をタグにする
+    progress(読んだ件数, -1) を各バッチ後に呼ぶ（総数は読み終えるまで分からない）。
+    戻り値は {"added", "merged", "overwritten", "unchanged"（登録済みで中身も同じ）, "skipped", "invalid"} の件数。
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown policy: {policy}")
+    fmt = fmt or detect_format(path)
+    stats = dict.fromkeys(("added", "merged", "overwritten", "unchanged", "skipped", "invalid"), 0)
+    done = 0
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as fh:
+        items = _READERS[fmt](fh, folders_as_tags=folders_as_tags)
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            _write_batch(batch, f, policy, stats)
+            done += len(batch)
+            if progress:
+                progress(done, -1)
+    return stats
@@ -0,0 +1,203 @@
+"""
+ページタイトルの取得（<head> だけを読む）。
+  - 本文を少しずつ読み、</head> が来たら（または TITLE_HEAD_MAX_BYTES で）読むのをやめる
+  - 文字コードは BOM → Content-Type の charset → <meta charset> の順で決め、どれも無いときだけ推定する（読んだ分だけで）
+  - <title> → og:title → twitter:title の順に、読んだ分を軽いパーサーで1回なめて探す
+  - <head> に見つからないときだけ、続きも同じパーサーに流して（TITLE_FULL_MAX_BYTES まで）全体から探す
+Qt を使わないのでワーカースレッドから呼べる。
+"""
+import re, html, time, codecs, threading
+from html.parser import HTMLParser
+from config import HTTP_TITLE_BUDGET_SEC, TITLE_HEAD_MAX_BYTES, TITLE_FULL_MAX_BYTES
+from http_client import get_client
+from utils import is_url
+
+PAGE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
+    "Referer": "https://www.google.com/",
+}
+_CHUNK = 16 * 1024
+_HEAD_END = re.compile(rb"</head[\s>]", re.I)
+_CTYPE_CHARSET = re.compile(r"charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+_META_CHARSET = re.compile(rb"<meta\s[^>]*?charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+# ブラウザと同じ読み替え（Shift_JIS は実際には Windows の拡張込みで書かれている 等）
+_CHARSET_ALIASES = {
+    "shift_jis": "cp932", "shift-jis": "cp932", "sjis": "cp932", "x-sjis": "cp932", "windows-31j": "cp932",
+    "iso-8859-1": "cp1252", "latin1": "cp1252", "latin-1": "cp1252", "us-ascii": "cp1252", "ascii": "cp1252",
+    "gb2312": "gb18030", "gbk": "gb18030", "x-gbk": "gb18030",
+}
+
+def _normalize_title_text(raw: str) -> str:
+    t = html.unescape(raw or "")
+    t = re.sub(r"\s+", " ", t).strip()
+    return t or ""
+
+# --- 文字コード ---
+def _lookup_charset(name: str | None, *, from_meta: bool = False) -> str | None:
+    if not name:
+        return None
+    name = name.strip().lower()
+    if from_meta and name.startswith("utf-16"):
+        return "utf-8"  # <meta> に utf-16 と書いてあっても、ここまで読めている以上 ASCII 互換
+    name = _CHARSET_ALIASES.get(name, name)
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+def sniff_charset(data: bytes, content_type: str = "") -> str:
+    """BOM → Content-Type → <meta> → UTF-8 として読めるか → 推定 の順で文字コードを決める。"""
+    for bom, enc in _BOMS:
+        if data.startswith(bom):
+            return enc
+    m = _CTYPE_CHARSET.search(content_type or "")
+    enc = _lookup_charset(m.group(1)) if m else None
+    if enc:
+        return enc
+    m = _META_CHARSET.search(data)
+    enc = _lookup_charset(m.group(1).decode("ascii", "ignore"), from_meta=True) if m else None
+    if enc:
+        return enc
+    try:
+        data.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        if e.start >= len(data) - 3 and e.reason == "unexpected end of data":
+            return "utf-8"  # 途中で切ったせいで最後の1文字が欠けただけ
+    from requests.compat import chardet
+    return _lookup_charset((chardet.detect(data) or {}).get("encoding")) or "utf-8"
+
+def decode_html(data: bytes, enc: str) -> str:
+    return data.decode(enc, errors="replace")
+
+# --- 取り出し ---
+class _Found(Exception):
+    pass
+
+class _TitleScanner(HTMLParser):
+    """<title>・og:title・twitter:title を拾う。<title> が取れた時点で打ち切る。"""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None; self.og = None; self.twitter = None
+        self._in_title = False; self._nested = False; self._buf = []; self._seen_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._in_title:
+            self._nested = True  # <title> の中にタグ → 文字列1つではないので使わない（旧実装と同じ）
+        if tag == "title" and not self._seen_title:
+            self._in_title = True; self._seen_title = True
+        elif tag == "meta":
+            a = dict(attrs)
+            content = (a.get("content") or "").strip()
+            if not content:
+                return
+            if self.og is None and a.get("property") == "og:title":
+                self.og = content
+            elif self.twitter is None and a.get("name") == "twitter:title":
+                self.twitter = content
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._buf.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            t = "".join(self._buf).strip()
+            if t and not self._nested:
+                self.title = t
+                raise _Found
+
+    def result(self) -> str | None:
+        return self.title or self.og or self.twitter
+
+# --- 読み込み ---
+def read_head(chunks, *, limit: int = TITLE_HEAD_MAX_BYTES) -> tuple[bytes, bool]:
+    """
+    chunks（bytes の列）を </head> が来るか limit まで読む。
+    (読んだバイト列, 続きがあるか) を返す。最後のチャンクは丸ごと入る。続きは同じ chunks から読める。
+    """
+    buf = bytearray()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        start = max(0, len(buf) - 6)
+        buf += chunk
+        m = _HEAD_END.search(buf, start)
+        if m or len(buf) >= limit:
+            return bytes(buf), True
+    return bytes(buf), False
+
+def title_from_chunks(chunks, content_type: str = "") -> tuple[str | None, bool | None]:
+    """
+    chunks から読んでタイトルを返す（正規化前）。2つ目は HTML だったか（空なら None）。
+    <head> に無く続きがあるときだけ、続きも同じパーサーに流して全体から探す（<title> が見つかれば止める）。
+    """
+    chunks = iter(chunks)
+    head, more = read_head(chunks)
+    if not head:
+        return None, None
+    if "html" not in (content_type or "").lower() and b"<html" not in head.lower():
+        return None, False
+    decoder = codecs.getincrementaldecoder(sniff_charset(head, content_type))(errors="replace")
+    p = _TitleScanner()
+    try:
+        p.feed(decoder.decode(head))
+        if p.result() is None and more:
+            read = len(head)
+            for chunk in chunks:
+                p.feed(decoder.decode(chunk))
+                read += len(chunk)
+                if read >= TITLE_FULL_MAX_BYTES:
+                    break
+            else:
+                p.feed(decoder.decode(b"", final=True))
+                p.close()
+        elif not more:
+            p.feed(decoder.decode(b"", final=True))
+            p.close()
+    except _Found:
+        pass
+    except Exception:
+        pass
+    return p.result(), True
+
+def _until(chunks, cancel):
+    for chunk in chunks:
+        if cancel.is_set():
+            return
+        yield chunk
+
+def get_page_title(url: str, *, cancel: threading.Event | None = None) -> str:
+    """タイトル（取れなければ url）。cancel が立つと読みかけでも止めて url を返す。"""
+    if not is_url(url): return url
+    client = get_client()
+    try:
+        with client.budget(HTTP_TITLE_BUDGET_SEC):
+            for i in range(2):
+                if cancel is not None and cancel.is_set():
+                    return url
+                res = client.get(url, headers=PAGE_HEADERS, timeout=(2 + i, 4 + 2*i), stream=True)
+                if res is None:
+                    time.sleep(0.1 * (2 ** i)); continue
+                try:
+                    chunks = res.iter_content(_CHUNK)
+                    if cancel is not None:
+                        chunks = _until(chunks, cancel)
+                    cand, is_html = title_from_chunks(chunks, res.headers.get("Content-Type") or "")
+                except Exception:
+                    cand, is_html = None, None
+                finally:
+                    res.close()
+                if cancel is not None and cancel.is_set():
+                    return url
+                if is_html is None:
+                    time.sleep(0.1 * (2 ** i)); continue
+                if is_html and cand:
+                    return _normalize_title_text(cand)
+                return url  # HTML でない・タイトルが無い（取り直しても同じ）
+    except Exception:
+        pass
+    return url
@@ -1,20 +1,236 @@
-import sqlite3, base64, os, hashlib
-from cryptography.fernet import Fernet
-from config import DB_FILE
-from utils import normalize_url
+import sqlite3, base64, os, sys, hashlib, hmac, json, time, atexit
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from config import (
+    DB_FILE, DECRYPT_EXECUTOR, DECRYPT_WORKERS, DECRYPT_CHUNK_SIZE, DECRYPT_PARALLEL_MIN,
+    SEARCH_INDEX_ENABLED, KDF_TARGET_MS
+)
+from utils import normalize_url, normalize_urls
 
 # --- 暗号 ---
 def _generate_key(password: str):
+    """旧方式（KDF導入前）：パスワードを32バイトに詰めてそのまま鍵にする。meta.kdf が無いDB用。"""
     return base64.urlsafe_b64encode(password.ljust(32, "0").encode("utf-8")[:32])
 
+class VaultKey(Fernet):
+    """Fernet に、同じ鍵から導出したブラインドインデックス用の HMAC 鍵を持たせたもの。"""
+    def __init__(self, key: bytes):
+        super().__init__(key)
+        self.index_key = hmac.new(base64.urlsafe_b64decode(key), b"SecretBookMarks/blind-index/v1",
+                                  hashlib.sha256).digest()
+
+# --- 鍵導出（KDF）: パラメータ（アルゴリズム・ソルト・コスト）は meta.kdf に JSON で保存 ---
+_SCRYPT_N_MIN, _SCRYPT_N_MAX = 2**14, 2**18   # 2**18 * r=8 で 256MB
+_PBKDF2_ITER_MIN = 310_000
+
+def derive_key(password: str, params: dict) -> bytes:
+    salt = base64.b64decode(params["salt"])
+    if params["alg"] == "scrypt":
+        kdf = Scrypt(salt=salt, length=32, n=params["n"], r=params["r"], p=params["p"])
+    elif params["alg"] == "pbkdf2-sha256":
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=params["iterations"])
+    else:
+        raise ValueError(f"unknown kdf: {params['alg']}")
+    return base64.urlsafe_b64encode(kdf.derive(password.encode("utf-8")))
+
+def calibrate_kdf(target_ms: int = KDF_TARGET_MS) -> dict:
+    """
+    このマシンで1回の導出が target_ms 前後になるパラメータを選ぶ（新しいソルト付き）。
+    scrypt（n は2のべき）を優先し、使えない環境では PBKDF2-SHA256 の反復回数で合わせる。
+    """
+    salt = base64.b64encode(os.urandom(16)).decode("ascii")
+    try:
+        params = {"alg": "scrypt", "salt": salt, "n": _SCRYPT_N_MIN, "r": 8, "p": 1}
+        t0 = time.perf_counter(); derive_key("calibration", params); dt = time.perf_counter() - t0
+        n = _SCRYPT_N_MIN
+        while n < _SCRYPT_N_MAX and dt * (n * 2 // _SCRYPT_N_MIN) * 1000 <= target_ms:
+            n *= 2
+        params["n"] = n
+        return params
+    except UnsupportedAlgorithm:
+        params = {"alg": "pbkdf2-sha256", "salt": salt, "iterations": 100_000}
+        t0 = time.perf_counter(); derive_key("calibration", params); dt = time.perf_counter() - t0
+        params["iterations"] = max(_PBKDF2_ITER_MIN, int(100_000 * target_ms / 1000 / max(dt, 1e-6)))
+        return params
+
+def get_kdf_params() -> dict | None:
+    """meta.kdf（無い・meta テーブルがまだ無いなら None＝旧方式）。"""
+    try:
+        raw = _meta_get("kdf")
+    except sqlite3.OperationalError:
+        return None  # init_db 前
+    return json.loads(raw) if raw else None
+
 def get_fernet(password: str) -> Fernet:
-    return Fernet(_generate_key(password))
+    """保管庫の鍵。meta.kdf があれば KDF で、無ければ旧方式で作る。"""
+    params = get_kdf_params()
+    return VaultKey(derive_key(password, params) if params else _generate_key(password))
+
+def create_vault_key(password: str) -> Fernet:
+    """新規保管庫用：KDF を較正してパラメータを保存し、その鍵を返す。"""
+    params = calibrate_kdf()
+    f = VaultKey(derive_key(password, params))
+    with get_db().transaction() as conn:
+        _meta_set(conn, "kdf", json.dumps(params))
+    return f
+
+def needs_kdf_upgrade() -> bool:
+    return get_kdf_params() is None
+
+def blind_key(f: Fernet, text: str) -> bytes:
+    """検索用の鍵付きハッシュ（HMAC-SHA256 先頭16バイト）。大文字小文字は区別しない。"""
+    return hmac.new(f.index_key, text.casefold().encode("utf-8"), hashlib.sha256).digest()[:16]
+
+# --- DB接続（長寿命の単一接続） ---
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",      # 読み書き並行 & コミットが軽い
+    "PRAGMA synchronous=NORMAL;",    # WAL なら NORMAL でも壊れない（電源断で直近コミットが消えうるだけ）
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-16000;",     # 約16MB
+    "PRAGMA mmap_size=67108864;",    # 64MB
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA foreign_keys=ON;",
+)
+
+class Database:
+    """
+    アプリ全体で1本だけ持つ SQLite 接続。
+      - 接続は初回アクセス時に開き、close() まで使い回す
+      - isolation_level=None（autocommit）にして、トランザクションは transaction() で明示
+      - 同じSQL文字列は cached_statements によりプリペアド文が再利用される
+    """
+    def __init__(self, path: str = DB_FILE, *, cached_statements: int = 256):
+        self.path = path
+        self._cached_statements = cached_statements
+        self._conn: sqlite3.Connection | None = None
+        self._depth = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None,
+                                   cached_statements=self._cached_statements)
+            for pragma in _PRAGMAS:
+                conn.execute(pragma)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        with db.transaction() as conn: ... で BEGIN〜COMMIT（例外なら ROLLBACK）。
+        ネストした場合は SAVEPOINT になり、外側のトランザクションにまとめてコミットされる。
+        """
+        conn = self.conn
+        depth = self._depth
+        conn.execute("BEGIN IMMEDIATE;" if depth == 0 else f"SAVEPOINT sp{depth};")
+        changes = conn.total_changes
+        self._depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._depth = depth
+            if depth == 0:
+                conn.execute("ROLLBACK;")
+            else:
+                conn.execute(f"ROLLBACK TO sp{depth};")
+                conn.execute(f"RELEASE sp{depth};")
+            raise
+        self._depth = depth
+        if depth == 0 and conn.total_changes != changes:
+            _bump_change_seq(conn)
+        conn.execute("COMMIT;" if depth == 0 else f"RELEASE sp{depth};")
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self.conn.execute(sql, params)
+
+    def executemany(self, sql: str, seq) -> sqlite3.Cursor:
+        return self.conn.executemany(sql, seq)
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.execute("PRAGMA optimize;")
+            except sqlite3.Error:
+                pass
+            self._conn.close()
+            self._conn = None
+            self._depth = 0
+
+def _bump_change_seq(conn):
+    # 書き込みのあったトランザクションごとに meta.change_seq を1つ進める（バックアップの要否の判断用）。
+    # WAL ではファイルヘッダの変更カウンタが動かず、data_version は他の接続の変更しか見えないため自前で持つ。
+    try:
+        conn.execute("""INSERT INTO meta (key, value) VALUES ('change_seq', 1)
+                        ON CONFLICT(key) DO UPDATE SET value = value + 1;""")
+    except sqlite3.OperationalError:
+        pass  # meta がまだ無い（init_db 前）
+
+_DB: Database | None = None
+
+def get_db() -> Database:
+    global _DB
+    if _DB is None:
+        _DB = Database(DB_FILE)
+    return _DB
+
+def open_db(path: str = DB_FILE) -> Database:
+    """別のDBファイルへ切り替える（ベンチ・検証用）。既存の接続は閉じる。"""
+    global _DB
+    close_db()
+    _DB = Database(path)
+    return _DB
+
+def close_db():
+    global _DB
+    if _DB is not None:
+        _DB.close()
+        _DB = None
+    _CACHE.clear()
+
+# --- レコード暗号化フォーマット ---
+# v1: enc_domain / enc_title / enc_url / enc_tags / enc_group を個別に暗号化（1行5トークン）
+# v2: [版, domain, title, url, tags, group] を JSON にまとめて enc_record に1トークンで保存
+# v3: [版, domain, title, url, group]。タグはレコードに持たず tags / bookmark_tag 表に置く
+RECORD_VERSION = 3
+
+def _encrypt_record(f: Fernet, domain: str, title: str, url: str, group: str) -> bytes:
+    payload = [RECORD_VERSION, domain, title, url, group or domain]
+    return f.encrypt(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def _decrypt_record(f: Fernet, token) -> tuple[str, str, str, str | None, str]:
+    """(domain, title, url, tags, group)。v3 の tags は None（bookmark_tag から引く）。"""
+    payload = json.loads(f.decrypt(token))
+    if payload[0] == RECORD_VERSION:
+        _, domain, title, url, group = payload
+        tags = None
+    elif payload[0] == 2:
+        _, domain, title, url, tags, group = payload
+    else:
+        raise ValueError(f"unknown record version: {payload[0]}")
+    return domain, title, url, tags, group or domain
+
+def _decrypt_legacy(f: Fernet, enc_domain, enc_title, enc_url, enc_tags, enc_group) -> tuple[str, str, str, str, str]:
+    domain = f.decrypt(enc_domain).decode("utf-8")
+    title  = f.decrypt(enc_title).decode("utf-8")
+    url    = f.decrypt(enc_url).decode("utf-8")
+    tags   = f.decrypt(enc_tags).decode("utf-8") if enc_tags else ""
+    group  = f.decrypt(enc_group).decode("utf-8") if enc_group else domain
+    return domain, title, url, tags, group
 
 # --- DB初期化 ---
 def init_db():
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("""
+    db = get_db()
+    with db.transaction() as conn:
+        conn.execute("""
         CREATE TABLE IF NOT EXISTS bookmarks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             enc_domain TEXT NOT NULL,
@@ -22,145 +238,1147 @@ def init_db():
             enc_url    TEXT NOT NULL,
             enc_tags   TEXT,
             enc_group  TEXT,
-            url_hash   TEXT   -- ★ 正規化URLのSHA256（平文）
+            url_hash   TEXT,  -- ★ 正規化URLのSHA256（平文）
+            enc_record TEXT   -- ★ v2: 全フィールドを1トークンで（v1列は空になる）
         );
         """)
-        conn.commit()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value BLOB
+        );
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id       INTEGER PRIMARY KEY AUTOINCREMENT,  -- 使い回さない（復号済みの表記をidで覚えるため）
+            name_key BLOB NOT NULL UNIQUE,  -- _tag_name_key(表記)：大文字小文字を区別
+            fold_key BLOB NOT NULL,         -- blind_key(表記)：大文字小文字を無視した絞り込み用
+            enc_name TEXT NOT NULL          -- 表記（タグごとに1回だけ暗号化）
+        );
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tags_fold ON tags(fold_key);")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS bookmark_tag (
+            bookmark_id INTEGER NOT NULL REFERENCES bookmarks(id) ON DELETE CASCADE,
+            tag_id      INTEGER NOT NULL REFERENCES tags(id),
+            pos         INTEGER NOT NULL,  -- ブックマーク内での並び
+            PRIMARY KEY (bookmark_id, tag_id)
+        ) WITHOUT ROWID;
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_bookmark_tag_tag ON bookmark_tag(tag_id);")
+        # どのブックマークからも使われなくなったタグは消す（ON DELETE CASCADE でも発火する）
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_bookmark_tag_gc AFTER DELETE ON bookmark_tag
+        WHEN NOT EXISTS (SELECT 1 FROM bookmark_tag WHERE tag_id = OLD.tag_id)
+        BEGIN
+            DELETE FROM tags WHERE id = OLD.tag_id;
+        END;
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_grams (
+            gram_key    BLOB NOT NULL,  -- _gram_key(3文字)
+            bookmark_id INTEGER NOT NULL REFERENCES bookmarks(id) ON DELETE CASCADE,
+            PRIMARY KEY (gram_key, bookmark_id)
+        ) WITHOUT ROWID;
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_search_grams_bm ON search_grams(bookmark_id);")
+
+def _meta_get(key: str, default=None):
+    row = get_db().execute("SELECT value FROM meta WHERE key=?;", (key,)).fetchone()
+    return row[0] if row else default
+
+def _meta_set(conn, key: str, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?);", (key, value))
+
+def data_change_counter() -> int:
+    """書き込みトランザクションの通し番号（meta.change_seq）。"""
+    return int(_meta_get("change_seq", 0))
+
+# --- パスワード確認（key-check カナリア） ---
+# meta.key_check に既知の平文を暗号化して置き、アンロック時はその1トークンだけ復号して確かめる。
+_KEY_CHECK_PLAINTEXT = b"SecretBookMarks/key-check/v1"
+_KEY_CHECK_SAMPLE = 16  # カナリアの無い旧DBで確認に使う行数
+
+def is_new_vault() -> bool:
+    """カナリアもブックマークも無い＝まだパスワードが決まっていないDB。"""
+    db = get_db()
+    return (_meta_get("key_check") is None
+            and db.execute("SELECT 1 FROM bookmarks LIMIT 1;").fetchone() is None)
+
+def write_key_check(f: Fernet):
+    with get_db().transaction() as conn:
+        _meta_set(conn, "key_check", f.encrypt(_KEY_CHECK_PLAINTEXT))
+
+def check_password(f: Fernet) -> bool:
+    """
+    f が保管庫の鍵として正しいか。カナリアがあれば O(1)。
+    無い旧DBは先頭の数行が復号できるかで判断し、正しければカナリアを書き足す。
+    """
+    token = _meta_get("key_check")
+    if token is not None:
+        try:
+            return f.decrypt(token) == _KEY_CHECK_PLAINTEXT
+        except InvalidToken:
+            return False
+    rows = get_db().execute(f"SELECT {_ROW_COLS} FROM bookmarks ORDER BY id LIMIT ?;", (_KEY_CHECK_SAMPLE,)).fetchall()
+    if rows and not any(_decrypt_values(r, f) for r in rows):
+        return False
+    write_key_check(f)
+    return True
 
 def ensure_group_column():
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("PRAGMA table_info(bookmarks);")
-        cols = [c[1] for c in cur.fetchall()]
+    db = get_db()
+    with db.transaction() as conn:
+        cols = [c[1] for c in conn.execute("PRAGMA table_info(bookmarks);").fetchall()]
         if "enc_group" not in cols:
-            cur.execute("ALTER TABLE bookmarks ADD COLUMN enc_group TEXT;")
+            conn.execute("ALTER TABLE bookmarks ADD COLUMN enc_group TEXT;")
         if "url_hash" not in cols:
-            cur.execute("ALTER TABLE bookmarks ADD COLUMN url_hash TEXT;")
-        conn.commit()
+            conn.execute("ALTER TABLE bookmarks ADD COLUMN url_hash TEXT;")
+        if "enc_record" not in cols:
+            conn.execute("ALTER TABLE bookmarks ADD COLUMN enc_record TEXT;")
 
-def compute_url_hash(url: str) -> str:
-    n = normalize_url(url)
+def migrate_to_record_format(f: Fernet, *, batch_size: int = 500, progress=None) -> int:
+    """
+    v1（5トークン）の行を現行形式（1トークン + タグ表）へ少しずつ書き換える。
+      - batch_size 行ずつ読み → executemany → コミット（中断しても次回続きから）
+      - 復号できない行（壊れた行・別パスワード）は v1 のまま残す
+    progress(done, total) を渡すと各バッチ後に呼ぶ。戻り値は変換した行数。
+    """
+    db = get_db()
+    total = db.execute("SELECT COUNT(*) FROM bookmarks WHERE enc_record IS NULL;").fetchone()[0]
+    done = 0; last_id = 0
+    while True:
+        rows = db.execute("""SELECT id, enc_domain, enc_title, enc_url, enc_tags, enc_group FROM bookmarks
+                             WHERE enc_record IS NULL AND id > ? ORDER BY id LIMIT ?;""",
+                          (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        updates = []; tag_lists = []
+        for row in rows:
+            try:
+                domain, title, url, tags, group = _decrypt_legacy(f, *row[1:])
+            except Exception:
+                continue
+            updates.append((_encrypt_record(f, domain, title, url, group), row[0]))
+            tag_lists.append((row[0], tags))
+        last_id = rows[-1][0]
+        if updates:
+            with db.transaction() as conn:
+                conn.executemany("""UPDATE bookmarks
+                                    SET enc_record=?, enc_domain='', enc_title='', enc_url='', enc_tags=NULL, enc_group=NULL
+                                    WHERE id=?""", updates)
+                for bm_id, tags in tag_lists:
+                    _set_tags(conn, bm_id, tags, f)
+        done += len(updates)
+        if progress:
+            progress(done, total)
+    if done:
+        invalidate_cache()
+    return done
+
+def compute_url_hash(url: str, *, normalized: bool = False) -> str:
+    """正規化URLの SHA256。normalized=True なら url は normalize_url 済みとして扱う（二度正規化しない）。"""
+    n = url if normalized else normalize_url(url)
     return hashlib.sha256(n.encode("utf-8")).hexdigest()
 
+def compute_url_hashes(urls) -> list[str]:
+    """compute_url_hash のまとめ版（normalize_urls で正規化。入力順）。"""
+    return [compute_url_hash(n, normalized=True) for n in normalize_urls(urls)]
+
 def _create_unique_index_for_urlhash(conn):
-    cur = conn.cursor()
-    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bookmarks_urlhash ON bookmarks(url_hash);")
-    conn.commit()
-
-def migrate_populate_url_hash(f: Fernet):
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        # url_hash が NULL/空のものだけ選別
-        cur.execute("SELECT id, enc_url FROM bookmarks WHERE (url_hash IS NULL OR url_hash='');")
-        rows = cur.fetchall()
-        for _id, enc_url in rows:
-            try:
-                url = f.decrypt(enc_url).decode("utf-8")
-            except Exception:
-                url = ""
-            h = compute_url_hash(url) if url else None
-            cur2 = conn.cursor()
-            cur2.execute("UPDATE bookmarks SET url_hash=? WHERE id=?", (h, _id))
-        conn.commit()
-        _create_unique_index_for_urlhash(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bookmarks_urlhash ON bookmarks(url_hash);")
+    conn.execute("DROP INDEX IF EXISTS idx_bookmarks_urlhash_dup;")
+
+def _has_unique_urlhash_index() -> bool:
+    return get_db().execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_bookmarks_urlhash';").fetchone() is not None
+
+def find_duplicate_urlhashes() -> list[list[int]]:
+    """同じ url_hash を持つ行の id のグループ（UNIQUE インデックスを作れない原因）。"""
+    rows = get_db().execute("""SELECT group_concat(id) FROM bookmarks
+                               WHERE url_hash IS NOT NULL AND url_hash != ''
+                               GROUP BY url_hash HAVING COUNT(*) > 1 ORDER BY MIN(id);""").fetchall()
+    return [sorted(int(i) for i in r[0].split(",")) for r in rows]
+
+def _fill_url_hash(db, f: Fernet, unique: bool, *, after: int, upto: int | None,
+                   batch_size: int, progress=None, total: int = -1) -> tuple[int, list, list]:
+    """after < id（<= upto）の url_hash が無い行を埋める。戻り値: (埋めた行数, ぶつかった組, 復号できなかった id)"""
+    done = 0; updated = 0; conflicts = []; unreadable = []
+    last_id = after
+    while True:
+        rows = db.execute(f"""SELECT {_ROW_COLS} FROM bookmarks
+                              WHERE (url_hash IS NULL OR url_hash='') AND id > ? AND id <= ? ORDER BY id LIMIT ?;""",
+                          (last_id, upto if upto is not None else sys.maxsize, batch_size)).fetchall()
+        if not rows:
+            break
+        updates = []; seen = {}
+        values = [v for v in _decrypt_chunk(rows, f) if v[3]]
+        readable = {v[0] for v in values}
+        unreadable += [r[0] for r in rows if r[0] not in readable]
+        for (bm_id, *_), h in zip(values, compute_url_hashes(v[3] for v in values)):
+            if unique:
+                # 既に UNIQUE がある場合、ぶつかる行は埋めずに報告へ回す
+                other = seen.get(h) or db.execute("SELECT id FROM bookmarks WHERE url_hash=?;", (h,)).fetchone()
+                if other:
+                    conflicts.append(sorted((other if isinstance(other, int) else other[0], bm_id)))
+                    continue
+                seen[h] = bm_id
+            updates.append((h, bm_id))
+        last_id = rows[-1][0]
+        with db.transaction() as conn:
+            conn.executemany("UPDATE bookmarks SET url_hash=? WHERE id=?;", updates)
+            if upto is None:
+                _meta_set(conn, "url_hash_checkpoint", last_id)
+        done += len(rows); updated += len(updates)
+        if progress:
+            progress(done, total)
+    return updated, conflicts, unreadable
+
+def migrate_populate_url_hash(f: Fernet, *, batch_size: int = 500, progress=None) -> dict:
+    """
+    url_hash が NULL/空の行を埋めて、idx_bookmarks_urlhash（UNIQUE）を作る。
+      - batch_size 行ずつ executemany → コミットし、処理済みの最後の id を meta に記録（中断しても続きから）
+      - 最後まで終わったら記録を消す。埋められなかった行（ぶつかる・復号できない）は次の起動でも見直して報告する
+      - 重複URLがあるときは UNIQUE を作らず（起動は止めない）、代わりに通常のインデックスを作る
+    progress(done, total) を渡すと各バッチ後に呼ぶ。
+    戻り値: {"updated": 埋めた行数, "duplicates": [[id, ...], ...], "unreadable": [復号できなかった id, ...]}
+    """
+    db = get_db()
+    start = int(_meta_get("url_hash_checkpoint") or 0)
+    total = db.execute("""SELECT COUNT(*) FROM bookmarks
+                          WHERE (url_hash IS NULL OR url_hash='') AND id > ?;""", (start,)).fetchone()[0]
+    unique = _has_unique_urlhash_index()
+    updated, conflicts, unreadable = _fill_url_hash(db, f, unique, after=start, upto=None,
+                                                    batch_size=batch_size, progress=progress, total=total)
+    if start:
+        # 中断からの再開: 記録より前に残っている行（前回ぶつかった・読めなかった）も見直す
+        n, c, u = _fill_url_hash(db, f, unique, after=0, upto=start, batch_size=batch_size)
+        updated += n; conflicts = c + conflicts; unreadable = u + unreadable
+
+    duplicates = conflicts if unique else find_duplicate_urlhashes()
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM meta WHERE key='url_hash_checkpoint';")
+        if not unique:
+            if duplicates:
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_bookmarks_urlhash_dup ON bookmarks(url_hash);")
+            else:
+                _create_unique_index_for_urlhash(conn)
+    if updated:
+        invalidate_cache()
+    return {"updated": updated, "duplicates": duplicates, "unreadable": unreadable}
+
+# --- ブックマーク1件（メモリ上の表現） ---
+def _split_tags(tags: str) -> list[str]:
+    return [t.strip() for t in (tags or "").split(",") if t.strip()]
+
+class Bookmark:
+    """
+    復号済みのブックマーク1件。大きな保管庫を丸ごとキャッシュするので dict ではなく __slots__ で持つ。
+      - domain / group / 各タグは sys.intern して、同じ文字列を全件で共有する
+      - tags は分割済みのタプル（表示・保存用の文字列は tags_str）
+    作成後は書き換えない（変更は replace() で新しいインスタンスを作る）。
+    """
+    __slots__ = ("id", "domain", "title", "url", "tags", "group", "url_hash")
+
+    def __init__(self, id: int, domain: str, title: str, url: str, tags, group: str, url_hash: str | None):
+        self.id = id
+        self.domain = sys.intern(domain)
+        self.title = title
+        self.url = url
+        self.tags = tuple(dict.fromkeys(sys.intern(t) for t in (_split_tags(tags) if isinstance(tags, str) else tags)))
+        self.group = sys.intern(group or domain)
+        self.url_hash = url_hash
+
+    @property
+    def tags_str(self) -> str:
+        return ", ".join(self.tags)
+
+    def replace(self, **fields) -> "Bookmark":
+        values = {k: getattr(self, k) for k in self.__slots__}
+        values.update(fields)
+        return Bookmark(**values)
+
+    def __repr__(self):
+        return f"Bookmark(id={self.id!r}, title={self.title!r}, url={self.url!r}, tags={self.tags!r})"
+
+# --- 復号済みキャッシュ ---
+
+class BookmarkCache:
+    """
+    復号済みレコード（id -> Bookmark）のキャッシュ。
+      - アンロック後、必要になった行から復号して貯める（ページ読み・id指定の読み出し）
+      - 全件が要る読み出し（ensure）では、まだ無い行だけを復号して complete にする
+      - このプロセスの CRUD はキャッシュをその場で更新する
+      - 他の接続（別プロセス等）のコミットは PRAGMA data_version の変化で検知し、捨てて読み直す
+    Bookmark は差し替え専用（GUI が参照を持つので中身は書き換えない）。
+    """
+    def __init__(self):
+        self.f: Fernet | None = None
+        self.records: dict[int, Bookmark] = {}
+        self.tag_counts: Counter = Counter()
+        self.tag_names: dict[int, str] = {}  # tags.id -> 復号済みの表記
+        self.data_version: int | None = None
+        self.complete = False
+
+    def clear(self):
+        self.f = None
+        self.records = {}
+        self.tag_counts = Counter()
+        self.tag_names = {}
+        self.data_version = None
+        self.complete = False
+
+    def _current_version(self) -> int:
+        return get_db().execute("PRAGMA data_version;").fetchone()[0]
+
+    def partial(self, f: Fernet) -> "BookmarkCache":
+        """部分的な読み出し用。鍵違い・外部変更があれば空にしてから返す。"""
+        if not (self.f is f and self.data_version == self._current_version()):
+            self.clear()
+            self.f = f
+            self.data_version = self._current_version()
+        return self
+
+    def ensure(self, f: Fernet) -> "BookmarkCache":
+        """全件を揃えて返す。"""
+        self.partial(f)
+        if not self.complete:
+            rows = [r for r in get_db().execute(_SQL_SELECT_ALL).fetchall() if r[0] not in self.records]
+            for bm in decrypt_rows(rows, f):
+                self._put(bm)
+            self.records = dict(sorted(self.records.items()))
+            self.complete = True
+        return self
+
+    def _put(self, bm: Bookmark):
+        old = self.records.get(bm.id)
+        if old is not None:
+            self.tag_counts.subtract(old.tags)
+        self.records[bm.id] = bm
+        self.tag_counts.update(bm.tags)
+
+    def _drop(self, bm_id: int):
+        old = self.records.pop(bm_id, None)
+        if old is not None:
+            self.tag_counts.subtract(old.tags)
+
+    # CRUD 側から呼ぶ（未ロードなら何もしない：次回 ensure で読み込まれる）
+    def put(self, bm: Bookmark):
+        if self.f is not None:
+            self._put(bm)
+
+    def patch(self, bm_id: int, **fields):
+        if self.f is not None and bm_id in self.records:
+            self._put(self.records[bm_id].replace(**fields))
+
+    def drop(self, bm_id: int):
+        if self.f is not None:
+            self._drop(bm_id)
+
+    def tags(self) -> set[str]:
+        return {t for t, n in self.tag_counts.items() if n > 0}
+
+_CACHE = BookmarkCache()
+
+def invalidate_cache():
+    """次回の読み出しで全件を読み直させる（パスワード変更・DB差し替え時など）。"""
+    _CACHE.clear()
+
+def bookmarks_cached(f: Fernet) -> bool:
+    """全件が復号済みでキャッシュにあるか（= get_all_bookmarks が即座に返るか）。"""
+    return _CACHE.f is f and _CACHE.complete and _CACHE.data_version == _CACHE._current_version()
 
 # --- CRUD ---
+_ROW_COLS = "id, enc_record, url_hash, enc_domain, enc_title, enc_url, enc_tags, enc_group"
+_SQL_INSERT = """
+INSERT INTO bookmarks (enc_record, url_hash, enc_domain, enc_title, enc_url)
+VALUES (?, ?, '', '', '');
+"""
+_SQL_SELECT_ALL = f"SELECT {_ROW_COLS} FROM bookmarks ORDER BY id;"
+_SQL_SELECT_ONE = f"SELECT {_ROW_COLS} FROM bookmarks WHERE id=?;"
+_SQL_UPDATE_RECORD = """UPDATE bookmarks
+                        SET enc_record=?, url_hash=?, enc_domain='', enc_title='', enc_url='', enc_tags=NULL, enc_group=NULL
+                        WHERE id=?"""
+_SQL_DELETE = "DELETE FROM bookmarks WHERE id=?"
+_SQL_FIND_BY_HASH = f"SELECT {_ROW_COLS} FROM bookmarks WHERE url_hash=? LIMIT 1;"
+
+def _decrypt_values(row, f: Fernet) -> tuple | None:
+    """_ROW_COLS の並びの1行を Bookmark の引数の並びに。v2 は1回、未移行の v1 は5回復号する。"""
+    try:
+        if row[1]:
+            domain, title, url, tags, group = _decrypt_record(f, row[1])
+        else:
+            domain, title, url, tags, group = _decrypt_legacy(f, *row[3:8])
+        return (row[0], domain, title, url, tags, group, row[2])
+    except Exception:
+        return None
+
+def _to_bookmarks(values: list[tuple], f: Fernet) -> list[Bookmark]:
+    """_decrypt_values の結果を Bookmark に。タグ表に移った行（tags が None）は bookmark_tag から埋める。"""
+    tag_map = _tags_for_ids([v[0] for v in values if v[4] is None], f)
+    return [Bookmark(*v) if v[4] is not None else Bookmark(*v[:4], tag_map.get(v[0], ()), *v[5:])
+            for v in values]
+
+def _decrypt_row(row, f: Fernet) -> Bookmark | None:
+    values = _decrypt_values(row, f)
+    return _to_bookmarks([values], f)[0] if values else None
+
+# --- 並列一括復号 ---
+_WORKER_FERNET: Fernet | None = None
+
+def _init_crypto_worker(f: Fernet):
+    global _WORKER_FERNET
+    _WORKER_FERNET = f
+
+def _decrypt_chunk(rows, f: Fernet | None = None) -> list[tuple]:
+    # ワーカーからはタプルで返す（intern はメインプロセス側の Bookmark 生成で効かせる）
+    f = f or _WORKER_FERNET
+    return [v for v in (_decrypt_values(r, f) for r in rows) if v is not None]
+
+def _chunks(seq, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+def _encrypt_chunk(items, f: Fernet | None = None) -> list[bytes]:
+    f = f or _WORKER_FERNET
+    return [_encrypt_record(f, domain, title, url, group) for domain, title, url, group in items]
+
+def _open_pool(f, *, workers: int | None = None, executor: str | None = None):
+    """
+    _map_chunks(pool=...) で使い回すプール（process/thread）。1コア・プロセスを起こせない環境では None。
+    f はワーカーへ渡す鍵（fn が受け取るもの。タプルでもよい）。
+    """
+    workers = workers or DECRYPT_WORKERS or os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    if (executor or DECRYPT_EXECUTOR) == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    try:
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_crypto_worker, initargs=(f,))
+    except OSError:
+        return None
+
+_SESSION_POOL = None  # (鍵, プール)。decrypt_rows / encrypt_records が使い回す
+
+def _session_pool(f: Fernet):
+    """
+    鍵 f 用のプールを初回だけ作って使い回す（spawn の環境でワーカーを毎回起こさないため）。
+    鍵が変わったら作り直す。作れない環境では None。
+    """
+    global _SESSION_POOL
+    if _SESSION_POOL is not None and _SESSION_POOL[0] is f:
+        return _SESSION_POOL[1]
+    shutdown_pool()
+    pool = _open_pool(f)
+    if pool is not None:
+        _SESSION_POOL = (f, pool)
+    return pool
+
+def shutdown_pool():
+    """使い回しているプールを閉じる（終了時。次に要るときはまた作る）。"""
+    global _SESSION_POOL
+    if _SESSION_POOL is not None:
+        _SESSION_POOL[1].shutdown(cancel_futures=True)
+        _SESSION_POOL = None
+
+atexit.register(shutdown_pool)
+
+def _map_chunks(fn, items: list, f: Fernet, *, workers: int | None = None, chunk_size: int | None = None,
+                executor: str | None = None, pool=None) -> list:
+    """
+    fn(chunk, f) を items のチャンクごとに呼んで結果をつなげる（入力順のまま）。
+    件数が DECRYPT_PARALLEL_MIN 以上ならプール（process/thread）へ配る。fn はモジュール直下の関数に限る。
+    pool（_open_pool）を渡すとそれを使い回す（閉じるのは呼び出し側）。渡さなければ鍵ごとのプール（_session_pool）、
+    workers / executor を指定したときだけ、その場でプールを作って閉じる（ベンチ用）。
+    """
+    chunk_size = chunk_size or DECRYPT_CHUNK_SIZE
+    if len(items) < max(DECRYPT_PARALLEL_MIN, chunk_size * 2):
+        return fn(items, f)
+    own = pool is None and (workers is not None or executor is not None)
+    if own:
+        pool = _open_pool(f, workers=min(workers or DECRYPT_WORKERS or os.cpu_count() or 1, -(-len(items) // chunk_size)),
+                          executor=executor)
+    elif pool is None:
+        pool = _session_pool(f)
+    if pool is None:
+        return fn(items, f)
+    try:
+        task = partial(fn, f=f) if isinstance(pool, ThreadPoolExecutor) else fn
+        out = []
+        for part in pool.map(task, _chunks(items, chunk_size)):
+            out.extend(part)
+        return out
+    except (OSError, BrokenProcessPool):
+        # プロセスを起こせない・落ちた環境ではその場で処理（壊れたプールは次回作り直す）
+        if _SESSION_POOL is not None and _SESSION_POOL[1] is pool:
+            shutdown_pool()
+        return fn(items, f)
+    finally:
+        if own:
+            pool.shutdown()
+
+def decrypt_rows(rows, f: Fernet, **pool) -> list[Bookmark]:
+    """_ROW_COLS 並びの行をまとめて復号する（結果は入力順のまま、壊れた行は飛ばす）。pool は _map_chunks へ。"""
+    return _to_bookmarks(_map_chunks(_decrypt_chunk, list(rows), f, **pool), f)
+
+def encrypt_records(items, f: Fernet, **pool) -> list[bytes]:
+    """(domain, title, url, group) の並びをまとめてレコードのトークンにする（入力順）。pool は _map_chunks へ。"""
+    return _map_chunks(_encrypt_chunk, list(items), f, **pool)
+
+def _get_bookmark(bm_id: int, f: Fernet) -> Bookmark | None:
+    if _CACHE.f is f and bm_id in _CACHE.records:
+        return _CACHE.records[bm_id]
+    row = get_db().execute(_SQL_SELECT_ONE, (bm_id,)).fetchone()
+    return _decrypt_row(row, f) if row else None
+
 def add_bookmark_to_db(domain, title, url, tags, group, f: Fernet):
     h = compute_url_hash(url)
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("""
-        INSERT INTO bookmarks (enc_domain, enc_title, enc_url, enc_tags, enc_group, url_hash)
-        VALUES (?, ?, ?, ?, ?, ?);
-        """, (
-            f.encrypt(domain.encode("utf-8")),
-            f.encrypt(title.encode("utf-8")),
-            f.encrypt(url.encode("utf-8")),
-            f.encrypt((tags or "").encode("utf-8")),
-            f.encrypt((group or domain).encode("utf-8")),
-            h
-        ))
-        conn.commit()
+    with get_db().transaction() as conn:
+        cur = conn.execute(_SQL_INSERT, (_encrypt_record(f, domain, title, url, group), h))
+        bm_id = cur.lastrowid
+        _set_tags(conn, bm_id, tags, f)
+        _index_grams(conn, bm_id, domain, title, url, tags, f)
+    _CACHE.put(Bookmark(bm_id, domain, title, url, tags or "", group, h))
+    return bm_id
 
 def get_all_bookmarks(f: Fernet):
-    data = []
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, enc_domain, enc_title, enc_url, enc_tags, enc_group, url_hash FROM bookmarks;")
-        for row in cur.fetchall():
-            try:
-                domain = f.decrypt(row[1]).decode("utf-8")
-                title  = f.decrypt(row[2]).decode("utf-8")
-                url    = f.decrypt(row[3]).decode("utf-8")
-                tags   = f.decrypt(row[4]).decode("utf-8") if row[4] else ""
-                group  = f.decrypt(row[5]).decode("utf-8") if row[5] else domain
-                urlhash = row[6]
-                data.append({"id": row[0], "domain": domain, "title": title, "url": url, "tags": tags, "group": group, "url_hash": urlhash})
-            except Exception:
-                continue
-    return data
+    return list(_CACHE.ensure(f).records.values())
+
+def get_bookmarks_page(f: Fernet, offset: int = 0, limit: int = 200, order: str = "desc",
+                       *, after_id: int | None = None) -> list[Bookmark]:
+    """
+    追加順（id = 追加の通し番号。主キーの B-tree でそのまま並ぶ）の1ページ分。
+    並びと範囲は SQL で決め、復号するのはそのページの行だけ。
+    after_id を渡すとその id の次から（キーセット方式：offset より速く、途中の追加・削除にも強い）。
+    """
+    desc = order == "desc"
+    where, params = "", []
+    if after_id is not None:
+        where = "WHERE id < ?" if desc else "WHERE id > ?"
+        params.append(after_id)
+    sql = f"SELECT id FROM bookmarks {where} ORDER BY id {'DESC' if desc else 'ASC'} LIMIT ? OFFSET ?;"
+    ids = [r[0] for r in get_db().execute(sql, params + [limit, offset]).fetchall()]
+    return get_bookmarks_by_ids(ids, f)
+
+# --- ストリーミング読み出し ---
+BOOKMARK_FIELDS = ("id", "domain", "title", "url", "tags", "group", "url_hash")
+_PLAIN_FIELDS = {"id", "url_hash"}
+_V1_COLS = {"domain": "enc_domain", "title": "enc_title", "url": "enc_url", "tags": "enc_tags", "group": "enc_group"}
+
+def _decrypt_fields(row, fields, f: Fernet) -> dict:
+    """
+    (id, url_hash, enc_record, enc_domain, ...) の1行から fields（と id / url_hash）を取り出す。
+    タグ表に移った行の tags は None（呼び出し側で bookmark_tag から埋める）。
+    """
+    out = {"id": row[0], "url_hash": row[1]}
+    enc = dict(zip(("enc_record",) + tuple(_V1_COLS.values()), row[2:]))
+    if enc["enc_record"]:
+        # v2 は1トークンなので丸ごと復号
+        domain, title, url, tags, group = _decrypt_record(f, enc["enc_record"])
+        out.update(domain=domain, title=title, url=url, tags=tags, group=group)
+    else:
+        # v1 は列ごとのトークンなので、要る列だけ復号
+        need = [k for k in fields if k in _V1_COLS]
+        if "group" in need and "domain" not in need:
+            need.append("domain")  # group が空なら domain を使う
+        for k in need:
+            token = enc[_V1_COLS[k]]
+            out[k] = f.decrypt(token).decode("utf-8") if token else ""
+        if "group" in out and not out["group"]:
+            out["group"] = out["domain"]
+    return out
+
+def iter_bookmarks(f: Fernet, fields=None, where: str | None = None, params=(), *, batch_size: int = 1000):
+    """
+    bookmarks を id 順に1件ずつ返すジェネレータ（fetchmany で batch_size 行ずつ読むので一定メモリ）。
+      - fields: 欲しいキー（BOOKMARK_FIELDS の部分集合。None で全部）。id/url_hash だけなら復号しない
+      - where / params: bookmarks に対する WHERE 句（例: "url_hash IS NULL"）
+    全件復号済みのキャッシュがあればそちらから返す。復号できない行は飛ばす
+    （v1 の行は要求された列だけを確かめる）。
+    """
+    fields = tuple(fields or BOOKMARK_FIELDS)
+    decrypt = any(k not in _PLAIN_FIELDS for k in fields)
+    cache = _CACHE if bookmarks_cached(f) else None
+    cols = "id, url_hash"
+    if decrypt and cache is None:
+        cols += ", enc_record, " + ", ".join(_V1_COLS.values())
+    cur = get_db().execute(f"SELECT {cols} FROM bookmarks {'WHERE ' + where if where else ''} ORDER BY id;", params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        if not decrypt:
+            for row in rows:
+                plain = {"id": row[0], "url_hash": row[1]}
+                yield {k: plain[k] for k in fields}
+        elif cache is not None:
+            for row in rows:
+                bm = cache.records.get(row[0])
+                if bm is not None:
+                    yield {k: (bm.tags_str if k == "tags" else getattr(bm, k)) for k in fields}
+        else:
+            out = []
+            for row in rows:
+                try:
+                    out.append(_decrypt_fields(row, fields, f))
+                except Exception:
+                    continue
+            if "tags" in fields:
+                tag_map = _tags_for_ids([d["id"] for d in out if d["tags"] is None], f)
+                for d in out:
+                    if d["tags"] is None:
+                        d["tags"] = ", ".join(tag_map.get(d["id"], ()))
+            for d in out:
+                yield {k: d[k] for k in fields}
 
 def update_bookmark_title(bm_id: int, new_title: str, f: Fernet):
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE bookmarks SET enc_title=? WHERE id=?",
-                    (f.encrypt(new_title.encode("utf-8")), bm_id))
-        conn.commit()
+    bm = _get_bookmark(bm_id, f)
+    if bm is None:
+        return
+    update_bookmark_full(bm_id, bm.domain, new_title, bm.url, bm.tags_str, bm.group, f)
 
 def update_bookmark_full(bm_id: int, domain: str, title: str, url: str, tags: str, group: str, f: Fernet):
     h = compute_url_hash(url)
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("""UPDATE bookmarks
-                       SET enc_domain=?, enc_title=?, enc_url=?, enc_tags=?, enc_group=?, url_hash=?
-                       WHERE id=?""",
-                    (f.encrypt(domain.encode("utf-8")),
-                     f.encrypt(title.encode("utf-8")),
-                     f.encrypt(url.encode("utf-8")),
-                     f.encrypt((tags or "").encode("utf-8")),
-                     f.encrypt((group or domain).encode("utf-8")),
-                     h,
-                     bm_id))
-        conn.commit()
+    with get_db().transaction() as conn:
+        conn.execute(_SQL_UPDATE_RECORD, (_encrypt_record(f, domain, title, url, group), h, bm_id))
+        _set_tags(conn, bm_id, tags, f)
+        _index_grams(conn, bm_id, domain, title, url, tags, f)
+    _CACHE.patch(bm_id, domain=domain, title=title, url=url, tags=tags or "",
+                 group=group or domain, url_hash=h)
 
 def delete_bookmark_by_id(bm_id: int):
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM bookmarks WHERE id=?", (bm_id,))
-        conn.commit()
+    with get_db().transaction() as conn:
+        conn.execute(_SQL_DELETE, (bm_id,))  # bookmark_tag / search_grams は ON DELETE CASCADE
+    _CACHE.drop(bm_id)
+
+# --- タグ辞書（tags / bookmark_tag） ---
+# 表記ごとに tags へ1行（暗号化は1回だけ）、ブックマークとは bookmark_tag で結ぶ。
+#   - name_key: 表記そのものの鍵付きハッシュ（同じ表記を1行にまとめる。大文字小文字を区別）
+#   - fold_key: blind_key（大文字小文字を無視した完全一致の絞り込み用）
+# タグの絞り込み・一括編集は SQL の集合演算で済み、ヒットした行だけ復号すればよい。
+_SQL_PARAM_CHUNK = 500  # IN (...) に渡すパラメータ数の上限
+
+def _tag_name_key(f: Fernet, name: str) -> bytes:
+    return hmac.new(f.index_key, b"tag:" + name.encode("utf-8"), hashlib.sha256).digest()[:16]
+
+def _tag_ids(conn, names, f: Fernet) -> list[int]:
+    """表記ごとの tags.id（無ければ作る）を names の並びで返す。"""
+    out = []
+    for name in names:
+        key = _tag_name_key(f, name)
+        row = conn.execute("SELECT id FROM tags WHERE name_key=?;", (key,)).fetchone()
+        if row is None:
+            row = (conn.execute("INSERT INTO tags (name_key, fold_key, enc_name) VALUES (?, ?, ?);",
+                                (key, blind_key(f, name), f.encrypt(name.encode("utf-8")))).lastrowid,)
+        out.append(row[0])
+    return out
+
+def _drop_unused_tags(conn, tag_ids):
+    """作ったが結局どこにも付かなかったタグを消す（外した分はトリガーが消す）。"""
+    for part in _chunks(list(tag_ids), _SQL_PARAM_CHUNK):
+        conn.execute(f"""DELETE FROM tags WHERE id IN ({','.join('?' * len(part))})
+                         AND NOT EXISTS (SELECT 1 FROM bookmark_tag WHERE tag_id = tags.id);""", part)
+
+def _set_tags(conn, bm_id: int, tags: str, f: Fernet):
+    """1件のタグを tags（カンマ区切り）の通りにする。残るタグは付け直さない。"""
+    ids = _tag_ids(conn, dict.fromkeys(_split_tags(tags)), f)
+    conn.execute(f"DELETE FROM bookmark_tag WHERE bookmark_id=? AND tag_id NOT IN ({','.join('?' * len(ids))});",
+                 [bm_id] + ids)
+    conn.executemany("""INSERT INTO bookmark_tag (bookmark_id, tag_id, pos) VALUES (?, ?, ?)
+                        ON CONFLICT (bookmark_id, tag_id) DO UPDATE SET pos = excluded.pos;""",
+                     [(bm_id, t, i) for i, t in enumerate(ids)])
+
+def _tag_names(tag_ids, f: Fernet) -> dict[int, str]:
+    """tags.id -> 表記。復号はタグごとに1回（キャッシュに覚える）。復号できないタグは入れない。"""
+    cache = _CACHE.partial(f)
+    missing = list({i for i in tag_ids if i not in cache.tag_names})
+    for part in _chunks(missing, _SQL_PARAM_CHUNK):
+        sql = f"SELECT id, enc_name FROM tags WHERE id IN ({','.join('?' * len(part))});"
+        for tag_id, enc in get_db().execute(sql, part).fetchall():
+            try:
+                cache.tag_names[tag_id] = sys.intern(f.decrypt(enc).decode("utf-8"))
+            except (InvalidToken, UnicodeDecodeError):
+                continue
+    return cache.tag_names
+
+def _tags_for_ids(bm_ids, f: Fernet) -> dict[int, list[str]]:
+    """bookmark_id -> タグ表記のリスト（付けた順）。"""
+    rows = []
+    for part in _chunks(list(bm_ids), _SQL_PARAM_CHUNK):
+        sql = (f"SELECT bookmark_id, tag_id FROM bookmark_tag WHERE bookmark_id IN ({','.join('?' * len(part))}) "
+               f"ORDER BY bookmark_id, pos;")
+        rows += get_db().execute(sql, part).fetchall()
+    if not rows:
+        return {}
+    names = _tag_names([r[1] for r in rows], f)
+    out: dict[int, list[str]] = {}
+    for bm_id, tag_id in rows:
+        if tag_id in names:
+            out.setdefault(bm_id, []).append(names[tag_id])
+    return out
+
+def migrate_tags_to_table(f: Fernet, *, batch_size: int = 500, progress=None) -> int:
+    """
+    v2 のレコードに埋め込まれたタグを tags / bookmark_tag へ移し、レコードを v3 に書き換える。
+      - batch_size 行ずつコミットし、meta.tag_table_checkpoint に進み具合を残す（中断しても続きから）
+      - 復号できない行は v2 のまま残す
+    最後まで見たら旧インデックス（bookmark_tags）を消す。戻り値は移した行数。
+    """
+    db = get_db()
+    if _meta_get("tag_table_built") or not check_password(f):
+        return 0
+    last_id = int(_meta_get("tag_table_checkpoint", 0))
+    total = db.execute("SELECT COUNT(*) FROM bookmarks WHERE id > ?;", (last_id,)).fetchone()[0]
+    done = seen = 0
+    while True:
+        rows = db.execute("SELECT id, enc_record FROM bookmarks WHERE id > ? AND enc_record IS NOT NULL "
+                          "ORDER BY id LIMIT ?;", (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        with db.transaction() as conn:
+            for bm_id, token in rows:
+                try:
+                    domain, title, url, tags, group = _decrypt_record(f, token)
+                except Exception:
+                    continue
+                if tags is None:
+                    continue  # 既に v3
+                conn.execute("UPDATE bookmarks SET enc_record=? WHERE id=?;",
+                             (_encrypt_record(f, domain, title, url, group), bm_id))
+                _set_tags(conn, bm_id, tags, f)
+                done += 1
+            last_id = rows[-1][0]
+            _meta_set(conn, "tag_table_checkpoint", last_id)
+        seen += len(rows)
+        if progress:
+            progress(seen, total)
+    with db.transaction() as conn:
+        conn.execute("DROP TABLE IF EXISTS bookmark_tags;")
+        conn.execute("DELETE FROM meta WHERE key IN ('tag_table_checkpoint', 'tag_index_built');")
+        _meta_set(conn, "tag_table_built", 1)
+    if done:
+        invalidate_cache()
+    return done
 
-# --- タグ集計 ---
 def collect_all_tags(f: Fernet):
+    if bookmarks_cached(f):
+        return _CACHE.tags()
+    if _meta_get("tag_table_built"):
+        # 使われているタグは tags に1行ずつ（未使用はトリガーで消える）なので、そこだけ読めばよい
+        ids = [r[0] for r in get_db().execute("SELECT id FROM tags;").fetchall()]
+        names = _tag_names(ids, f)
+        return {names[i] for i in ids if i in names}
     tags = set()
-    for bm in get_all_bookmarks(f):
-        for t in (bm["tags"] or "").split(","):
-            t = t.strip()
-            if t: tags.add(t)
+    for bm in iter_bookmarks(f, fields=("tags",)):
+        tags.update(_split_tags(bm["tags"]))
     return tags
 
 def update_bookmark_tags(bm_id: int, new_tags: str, f: Fernet):
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE bookmarks SET enc_tags=? WHERE id=?",
-                    (f.encrypt((new_tags or "").encode("utf-8")), bm_id))
-        conn.commit()
+    bm = _get_bookmark(bm_id, f)
+    if bm is None:
+        return
+    update_bookmark_full(bm_id, bm.domain, bm.title, bm.url, new_tags, bm.group, f)
+
+def find_ids_by_tags(tags: list[str], f: Fernet, *, mode: str = "and") -> list[int]:
+    """tags に一致する bookmark_id（昇順）。mode="and" は全タグを持つもの、"or" はいずれかを持つもの。"""
+    keys = list({blind_key(f, t) for t in tags if t.strip()})
+    if not keys:
+        return []
+    marks = ",".join("?" * len(keys))
+    base = f"FROM tags t JOIN bookmark_tag bt ON bt.tag_id = t.id WHERE t.fold_key IN ({marks})"
+    if mode == "or":
+        sql = f"SELECT DISTINCT bt.bookmark_id {base} ORDER BY bt.bookmark_id;"
+        params = keys
+    else:
+        sql = (f"SELECT bt.bookmark_id {base} "
+               f"GROUP BY bt.bookmark_id HAVING COUNT(DISTINCT t.fold_key)=? ORDER BY bt.bookmark_id;")
+        params = keys + [len(keys)]
+    return [r[0] for r in get_db().execute(sql, params).fetchall()]
+
+def get_bookmarks_by_ids(ids: list[int], f: Fernet) -> list[Bookmark]:
+    """id の並び順で返す。キャッシュに無い行だけ復号して、キャッシュにも入れる。"""
+    cache = _CACHE.partial(f)
+    missing = [i for i in ids if i not in cache.records]
+    if missing and not cache.complete:
+        for part in _chunks(missing, _SQL_PARAM_CHUNK):
+            sql = f"SELECT {_ROW_COLS} FROM bookmarks WHERE id IN ({','.join('?' * len(part))});"
+            for bm in decrypt_rows(get_db().execute(sql, part).fetchall(), f):
+                cache._put(bm)
+    return [cache.records[i] for i in ids if i in cache.records]
+
+def get_bookmarks_by_tags(tags: list[str], f: Fernet, *, mode: str = "and") -> list[Bookmark]:
+    return get_bookmarks_by_ids(find_ids_by_tags(tags, f, mode=mode), f)
+
+# --- キーワード検索インデックス（search_grams、オプトイン） ---
+# 検索対象の文字列（GUIの検索と同じ「title url domain tags」を小文字化したもの）の
+# 3文字ごとの鍵付きハッシュを持つ。語のすべての3文字片を含む行だけが候補になるので、
+# 候補に部分一致の最終確認をかければ全件走査と同じ結果になる（ハッシュ衝突は確認で落ちる）。
+GRAM_SIZE = 3
+
+def search_text(domain: str, title: str, url: str, tags: str) -> str:
+    return f"{title} {url} {domain} {tags}".lower()
+
+def _grams(text: str) -> set[str]:
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+def _gram_key(f: Fernet, gram: str) -> bytes:
+    return hmac.new(f.index_key, b"gram:" + gram.encode("utf-8"), hashlib.sha256).digest()[:8]
+
+def _search_index_on() -> bool:
+    return bool(_meta_get("search_index_built"))
+
+def _join_tags(tags: str) -> str:
+    # 索引するタグは、全件構築（タグ表から）・GUI の確認（tags_str）と同じく正規化した形にそろえる
+    return ", ".join(_split_tags(tags))
+
+def _index_grams(conn, bm_id: int, domain, title, url, tags, f: Fernet):
+    if not _search_index_on():
+        return
+    conn.execute("DELETE FROM search_grams WHERE bookmark_id=?;", (bm_id,))
+    conn.executemany("INSERT OR IGNORE INTO search_grams (gram_key, bookmark_id) VALUES (?, ?);",
+                     [(_gram_key(f, g), bm_id) for g in _grams(search_text(domain, title, url, _join_tags(tags)))])
+
+def ensure_search_index(f: Fernet, *, enabled: bool = SEARCH_INDEX_ENABLED, batch_size: int = 500, progress=None):
+    """
+    enabled なら未構築の索引を全件から作る。
+      - batch_size 行ずつコミットし、meta.search_index_checkpoint に進み具合を残す（中断しても続きから）
+      - 最後まで作り終えるまで索引は使わない（search_index_built が立つまで検索は全件走査）
+    無効なら既存の索引を作りかけも含めて消す（放置すると以後の更新が反映されず古くなるため）。
+    progress(done, total) を渡すと各バッチ後に呼ぶ。
+    """
+    db = get_db()
+    if not enabled:
+        if _search_index_on() or _meta_get("search_index_checkpoint") is not None:
+            with db.transaction() as conn:
+                conn.execute("DELETE FROM search_grams;")
+                conn.execute("DELETE FROM meta WHERE key IN ('search_index_built', 'search_index_checkpoint');")
+        return
+    if _search_index_on() or not check_password(f):
+        return
+    last_id = _meta_get("search_index_checkpoint")
+    if last_id is None:
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM search_grams;")
+    last_id = int(last_id or 0)
+    total = db.execute("SELECT COUNT(*) FROM bookmarks WHERE id > ?;", (last_id,)).fetchone()[0]
+    done = 0
+    while True:
+        ids = [r[0] for r in db.execute("SELECT id FROM bookmarks WHERE id > ? ORDER BY id LIMIT ?;",
+                                        (last_id, batch_size)).fetchall()]
+        if not ids:
+            break
+        part = iter_bookmarks(f, fields=("id", "domain", "title", "url", "tags"),
+                              where="id > ? AND id <= ?", params=(last_id, ids[-1]))
+        with db.transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO search_grams (gram_key, bookmark_id) VALUES (?, ?);",
+                             [(_gram_key(f, g), bm["id"])
+                              for bm in part
+                              for g in _grams(search_text(bm["domain"], bm["title"], bm["url"], _join_tags(bm["tags"])))])
+            last_id = ids[-1]
+            _meta_set(conn, "search_index_checkpoint", last_id)
+        done += len(ids)
+        if progress:
+            progress(done, total)
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM meta WHERE key='search_index_checkpoint';")
+        _meta_set(conn, "search_index_built", 1)
+
+def find_ids_by_keywords(terms: list[str], f: Fernet) -> list[int] | None:
+    """
+    全 terms の3文字片をすべて含む bookmark_id（昇順）= 候補。部分一致の確認は呼び出し側で行う。
+    索引が無い、または全ての語が3文字未満で絞れないときは None（全件を走査してね）。
+    """
+    grams = set()
+    for t in terms:
+        grams |= _grams(t.lower())
+    if not grams or not _search_index_on():
+        return None
+    keys = list({_gram_key(f, g) for g in grams})
+    sql = (f"SELECT bookmark_id FROM search_grams WHERE gram_key IN ({','.join('?' * len(keys))}) "
+           f"GROUP BY bookmark_id HAVING COUNT(*)=? ORDER BY bookmark_id;")
+    return [r[0] for r in get_db().execute(sql, keys + [len(keys)]).fetchall()]
+
+# --- 一括書き込み（複数行を1トランザクションで） ---
+def _next_bookmark_id(conn) -> int:
+    row = conn.execute("""SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name='bookmarks'), 0),
+                                     COALESCE((SELECT MAX(id) FROM bookmarks), 0));""").fetchone()
+    return row[0] + 1
+
+def add_bookmarks_bulk(items, f: Fernet, *, hashes: list[str] | None = None) -> list[Bookmark]:
+    """
+    (domain, title, url, tags, group) の並びをまとめて追加する（1トランザクション・executemany）。
+    レコードの暗号化は encrypt_records で並列に、タグはタグごとに1回だけ暗号化する。
+    url_hash の重複は呼び出し側で除いておくこと（UNIQUE 索引にぶつかると全体が ROLLBACK される）。
+    hashes（各 url の compute_url_hash）を計算済みなら渡せる。追加した Bookmark を入力順で返す。
+    """
+    items = [(domain, title, url, tags or "", group or domain) for domain, title, url, tags, group in items]
+    if not items:
+        return []
+    tokens = encrypt_records([(d, t, u, g) for d, t, u, _, g in items], f)
+    hashes = hashes or compute_url_hashes(u for _, _, u, _, _ in items)
+    db = get_db()
+    with db.transaction() as conn:
+        # id を先に決めれば行ごとの lastrowid が要らない（書き込みは1接続なので他と被らない）
+        first = _next_bookmark_id(conn)
+        ids = range(first, first + len(items))
+        conn.executemany("""INSERT INTO bookmarks (id, enc_record, url_hash, enc_domain, enc_title, enc_url)
+                            VALUES (?, ?, ?, '', '', '');""", zip(ids, tokens, hashes))
+        tag_lists = [list(dict.fromkeys(_split_tags(tags))) for _, _, _, tags, _ in items]
+        names = list(dict.fromkeys(t for tl in tag_lists for t in tl))
+        tag_id = dict(zip(names, _tag_ids(conn, names, f)))
+        conn.executemany("INSERT INTO bookmark_tag (bookmark_id, tag_id, pos) VALUES (?, ?, ?);",
+                         [(bm_id, tag_id[t], pos) for bm_id, tl in zip(ids, tag_lists) for pos, t in enumerate(tl)])
+        if _search_index_on():
+            for bm_id, (domain, title, url, tags, _) in zip(ids, items):
+                _index_grams(conn, bm_id, domain, title, url, tags, f)
+    bms = [Bookmark(bm_id, domain, title, url, tl, group, h)
+           for bm_id, (domain, title, url, _, group), tl, h in zip(ids, items, tag_lists, hashes)]
+    for bm in bms:
+        _CACHE.put(bm)
+    return bms
+
+def update_bookmarks_bulk(items, f: Fernet, *, hashes: list[str] | None = None) -> list[Bookmark]:
+    """
+    (id, domain, title, url, tags, group) の並びでまとめて書き換える（1トランザクション・executemany）。
+    レコードの暗号化は encrypt_records で並列に。hashes は add_bookmarks_bulk と同じ。
+    書き換えた Bookmark を入力順で返す。
+    """
+    items = [(bm_id, domain, title, url, tags or "", group or domain) for bm_id, domain, title, url, tags, group in items]
+    if not items:
+        return []
+    tokens = encrypt_records([(d, t, u, g) for _, d, t, u, _, g in items], f)
+    hashes = hashes or compute_url_hashes(u for _, _, _, u, _, _ in items)
+    with get_db().transaction() as conn:
+        conn.executemany(_SQL_UPDATE_RECORD, [(tok, h, it[0]) for tok, h, it in zip(tokens, hashes, items)])
+        for bm_id, domain, title, url, tags, _ in items:
+            _set_tags(conn, bm_id, tags, f)
+            _index_grams(conn, bm_id, domain, title, url, tags, f)
+    bms = [Bookmark(bm_id, domain, title, url, tags, group, h)
+           for (bm_id, domain, title, url, tags, group), h in zip(items, hashes)]
+    for bm in bms:
+        _CACHE.patch(bm.id, **{k: getattr(bm, k) for k in Bookmark.__slots__ if k != "id"})
+    return bms
+
+def delete_bookmarks_bulk(bm_ids: list[int]) -> list[int]:
+    """まとめて削除する（1トランザクション）。実際に消えた id を返す。"""
+    deleted = []
+    with get_db().transaction() as conn:
+        for part in _chunks(list(dict.fromkeys(bm_ids)), _SQL_PARAM_CHUNK):
+            deleted += [r[0] for r in conn.execute(
+                f"DELETE FROM bookmarks WHERE id IN ({','.join('?' * len(part))}) RETURNING id;", part).fetchall()]
+    for bm_id in deleted:
+        _CACHE.drop(bm_id)
+    return deleted
+
+def update_tags_bulk(bm_ids: list[int], mode: str, tags: list[str], f: Fernet) -> list[Bookmark]:
+    """
+    複数のブックマークのタグを bookmark_tag への集合演算でまとめて変える（1トランザクション、レコードは再暗号化しない）。
+      - "add": 大文字小文字を無視して、まだ無いタグだけ末尾に足す
+      - "remove": 表記が完全に一致するタグを外す
+      - "replace": tags に置き換える
+    タグが実際に変わった Bookmark（変更後）を返す。
+    """
+    bm_ids = list(dict.fromkeys(bm_ids))
+    names = list(dict.fromkeys(t.strip() for t in tags if t.strip()))
+    db = get_db()
+    with db.transaction() as conn:
+        before = _tags_for_ids(bm_ids, f)
+        if mode == "remove":
+            keys = [_tag_name_key(f, n) for n in names]
+            tag_ids = [r[0] for r in conn.execute(
+                f"SELECT id FROM tags WHERE name_key IN ({','.join('?' * len(keys))});", keys).fetchall()]
+            if tag_ids:
+                for part in _chunks(bm_ids, _SQL_PARAM_CHUNK):
+                    conn.execute(f"DELETE FROM bookmark_tag WHERE tag_id IN ({','.join('?' * len(tag_ids))}) "
+                                 f"AND bookmark_id IN ({','.join('?' * len(part))});", tag_ids + part)
+        elif mode == "add":
+            tag_ids = _tag_ids(conn, names, f)
+            for name, tag_id in zip(names, tag_ids):
+                fold = blind_key(f, name)
+                for part in _chunks(bm_ids, _SQL_PARAM_CHUNK):
+                    conn.execute(f"""
+                        INSERT INTO bookmark_tag (bookmark_id, tag_id, pos)
+                        SELECT b.id, ?, COALESCE((SELECT MAX(pos) + 1 FROM bookmark_tag WHERE bookmark_id = b.id), 0)
+                        FROM bookmarks b
+                        WHERE b.id IN ({','.join('?' * len(part))})
+                          AND NOT EXISTS (SELECT 1 FROM bookmark_tag x JOIN tags t ON t.id = x.tag_id
+                                          WHERE x.bookmark_id = b.id AND t.fold_key = ?);""",
+                                 [tag_id] + part + [fold])
+            _drop_unused_tags(conn, tag_ids)
+        elif mode == "replace":
+            tag_ids = _tag_ids(conn, names, f)
+            for part in _chunks(bm_ids, _SQL_PARAM_CHUNK):
+                conn.execute(f"DELETE FROM bookmark_tag WHERE bookmark_id IN ({','.join('?' * len(part))}) "
+                             f"AND tag_id NOT IN ({','.join('?' * len(tag_ids))});", part + tag_ids)
+            conn.executemany("""INSERT INTO bookmark_tag (bookmark_id, tag_id, pos)
+                                SELECT id, ?, ? FROM bookmarks WHERE id=?
+                                ON CONFLICT (bookmark_id, tag_id) DO UPDATE SET pos = excluded.pos;""",
+                             [(t, i, b) for b in bm_ids for i, t in enumerate(tag_ids)])
+            _drop_unused_tags(conn, tag_ids)
+        else:
+            raise ValueError(f"unknown mode: {mode}")
+        after = _tags_for_ids(bm_ids, f)
+        changed = [i for i in bm_ids if before.get(i, []) != after.get(i, [])]
+        if changed and _search_index_on():
+            # 検索索引はタグも含むので、変わった行だけ作り直す
+            for bm in get_bookmarks_by_ids(changed, f):
+                _index_grams(conn, bm.id, bm.domain, bm.title, bm.url, ", ".join(after.get(bm.id, ())), f)
+    for bm_id in changed:
+        _CACHE.patch(bm_id, tags=after.get(bm_id, ()))
+    return get_bookmarks_by_ids(changed, f)
+
+# --- 鍵の付け替え（re-key） ---
+# 1) 影テーブル rekey_shadow に新しい鍵のトークンを貯める（バッチごとにコミット。bookmarks には触らない）
+# 2) 最後の1トランザクションで、タグ辞書を付け替え・影から bookmarks へ一括で写す・索引とカナリアを差し替える
+# 1) の途中で落ちても bookmarks は古い鍵のまま（残った影は次の re-key の最初に捨てる）。
+def _rekey_chunk(items, f=None) -> list[tuple]:
+    # items は (_ROW_COLS の行, タグ表から引いたタグ文字列)。f = (old_f, new_f, 検索索引を作るか)
+    # (id, 新トークン, v1/v2 のタグ文字列 or None, 新しい鍵の gram_key の並び) を返す
+    old_f, new_f, grams_on = f or _WORKER_FERNET
+    out = []
+    for row, tag_str in items:
+        v = _decrypt_values(row, old_f)
+        if v is None:
+            continue
+        bm_id, domain, title, url, tags, group, _ = v
+        keys = [_gram_key(new_f, g) for g in _grams(search_text(domain, title, url, tag_str if tags is None else _join_tags(tags)))] \
+            if grams_on else []
+        out.append((bm_id, _encrypt_record(new_f, domain, title, url, group), tags, keys))
+    return out
+
+def _drop_rekey_shadow(conn):
+    conn.execute("DROP TABLE IF EXISTS rekey_shadow;")
+    conn.execute("DROP TABLE IF EXISTS rekey_shadow_grams;")
+
+def _fill_rekey_shadow(old_f: Fernet, new_f: Fernet, names: dict, grams_on: bool,
+                       batch_size: int, total: int, progress) -> tuple[int, list]:
+    """影テーブルへ新しい鍵のトークン（と検索索引）を貯める。(影に入れた行数, v1/v2 の (id, タグ)) を返す。"""
+    db = get_db()
+    legacy = []  # v1 / v2 の行のタグ（平文なので影テーブルには置かない）
+    done = shadowed = 0; last_id = 0
+    keys = (old_f, new_f, grams_on)
+    pool = _open_pool(keys)
+    try:
+        while True:
+            rows = db.execute(f"SELECT {_ROW_COLS} FROM bookmarks WHERE id > ? ORDER BY id LIMIT ?;",
+                              (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            tag_map = {}
+            if grams_on:
+                for part in _chunks([r[0] for r in rows], _SQL_PARAM_CHUNK):
+                    for bm_id, tag_id in db.execute(
+                            f"SELECT bookmark_id, tag_id FROM bookmark_tag WHERE bookmark_id IN ({','.join('?' * len(part))}) "
+                            f"ORDER BY bookmark_id, pos;", part).fetchall():
+                        if tag_id in names:
+                            tag_map.setdefault(bm_id, []).append(names[tag_id])
+            out = _map_chunks(_rekey_chunk, [(r, ", ".join(tag_map.get(r[0], ()))) for r in rows], keys, pool=pool)
+            src = {r[0]: (r[1], r[4]) for r in rows}
+            with db.transaction() as conn:
+                conn.executemany("INSERT INTO rekey_shadow (id, src_record, src_title, enc_record) VALUES (?, ?, ?, ?);",
+                                 [(bm_id, *src[bm_id], tok) for bm_id, tok, _, _ in out])
+                if grams_on:
+                    conn.executemany("INSERT INTO rekey_shadow_grams (gram_key, bookmark_id) VALUES (?, ?);",
+                                     [(k, bm_id) for bm_id, _, _, gram_keys in out for k in gram_keys])
+            legacy += [(bm_id, tags) for bm_id, _, tags, _ in out if tags is not None]
+            shadowed += len(out)
+            done += len(rows)
+            if progress:
+                progress(done, total)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return shadowed, legacy
+
+def rekey_vault(old_f: Fernet, new_f: Fernet, *, kdf_params: dict | None = None,
+                batch_size: int = 10000, progress=None) -> int:
+    """
+    全行を old_f で復号して new_f で暗号化し直す。戻り値は付け替えた行数。
+      - 復号・暗号化は batch_size 件ずつ _map_chunks で並列に（プールは全体で1つ）
+      - v1 / v2 の行もついでに現行形式になる
+      - タグ辞書と、鍵から導出するブラインドインデックス（タグ・検索）・カナリアも作り直す
+      - kdf_params を渡すと meta.kdf も同じトランザクションで書き換える
+    切り替えは最後の1トランザクションだけなので、途中で落ちても古い鍵のデータがそのまま残る。
+    その間に他から保管庫が書き換えられていたら RuntimeError（何も変えない）。
+    old_f で復号できない行はそのまま（どの鍵でも読めないため）。
+    progress(処理した行数, 総数) をバッチごとに呼ぶ。
+    """
+    db = get_db()
+    total = db.execute("SELECT COUNT(*) FROM bookmarks;").fetchone()[0]
+    grams_on = _search_index_on()
+    names = {}
+    for tag_id, enc in db.execute("SELECT id, enc_name FROM tags;").fetchall():
+        try:
+            names[tag_id] = old_f.decrypt(enc).decode("utf-8")
+        except InvalidToken:
+            continue
+    with db.transaction() as conn:
+        _drop_rekey_shadow(conn)
+        conn.execute("""CREATE TABLE rekey_shadow (
+                            id INTEGER PRIMARY KEY, src_record BLOB, src_title BLOB, enc_record BLOB NOT NULL);""")
+        conn.execute("CREATE TABLE rekey_shadow_grams (gram_key BLOB NOT NULL, bookmark_id INTEGER NOT NULL);")
+    try:
+        shadowed, legacy = _fill_rekey_shadow(old_f, new_f, names, grams_on, batch_size, total, progress)
+        with db.transaction() as conn:
+            # タグ辞書: 表記は1回ずつ付け替えるだけ（bookmark_tag は tags.id のままでよい）
+            conn.executemany("UPDATE tags SET name_key=?, fold_key=?, enc_name=? WHERE id=?;",
+                             [(_tag_name_key(new_f, name), blind_key(new_f, name),
+                               new_f.encrypt(name.encode("utf-8")), tag_id) for tag_id, name in names.items()])
+            # 影から一括で写す。読んだ時から変わっていない行だけ（他から書き換えられていたら全部やめる）
+            n = conn.execute("""UPDATE bookmarks
+                                SET enc_record=s.enc_record, enc_domain='', enc_title='', enc_url='',
+                                    enc_tags=NULL, enc_group=NULL
+                                FROM rekey_shadow AS s
+                                WHERE s.id=bookmarks.id AND s.src_record IS bookmarks.enc_record
+                                  AND s.src_title IS bookmarks.enc_title;""").rowcount
+            now = conn.execute("SELECT COUNT(*) FROM bookmarks;").fetchone()[0]
+            if n != shadowed or now != total:
+                raise RuntimeError("鍵の付け替え中に保管庫が書き換えられました")
+            for bm_id, tags in legacy:
+                _set_tags(conn, bm_id, tags, new_f)  # v1 / v2 の行はここでタグ表へ
+            if grams_on:
+                conn.execute("DELETE FROM search_grams;")
+                conn.execute("""INSERT OR IGNORE INTO search_grams (gram_key, bookmark_id)
+                                SELECT gram_key, bookmark_id FROM rekey_shadow_grams;""")
+            _meta_set(conn, "key_check", new_f.encrypt(_KEY_CHECK_PLAINTEXT))
+            if kdf_params is not None:
+                _meta_set(conn, "kdf", json.dumps(kdf_params))
+            _drop_rekey_shadow(conn)
+    except BaseException:
+        with db.transaction() as conn:
+            _drop_rekey_shadow(conn)
+        raise
+    invalidate_cache()
+    return shadowed
+
+def upgrade_kdf(password: str, old_f: Fernet, *, progress=None) -> Fernet:
+    """旧方式の鍵の保管庫を、較正した KDF の鍵へ移す。新しい鍵を返す。"""
+    params = calibrate_kdf()
+    new_f = VaultKey(derive_key(password, params))
+    rekey_vault(old_f, new_f, kdf_params=params, progress=progress)
+    return new_f
+
+def change_password(old_f: Fernet, new_password: str, *, progress=None) -> Fernet:
+    """パスワードを変える（KDF も較正し直す）。新しい鍵を返す。old_f が保管庫の鍵でなければ ValueError。"""
+    if not check_password(old_f):
+        raise ValueError("現在のパスワードが違います")
+    return upgrade_kdf(new_password, old_f, progress=progress)
 
 # --- 重複検索 ---
+def find_ids_by_urlhashes(hashes) -> dict[str, int]:
+    """url_hash -> id（idx_bookmarks_urlhash を IN でまとめて引く。復号はしない）。"""
+    out = {}
+    for part in _chunks(list(dict.fromkeys(hashes)), _SQL_PARAM_CHUNK):
+        sql = f"SELECT url_hash, id FROM bookmarks WHERE url_hash IN ({','.join('?' * len(part))});"
+        for h, bm_id in get_db().execute(sql, part).fetchall():
+            out.setdefault(h, bm_id)
+    return out
+
 def find_bookmark_by_urlhash(url_hash: str, f: Fernet):
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, enc_domain, enc_title, enc_url, enc_tags, enc_group FROM bookmarks WHERE url_hash=? LIMIT 1;", (url_hash,))
-        row = cur.fetchone()
-        if not row:
-            return None
-        try:
-            return {
-                "id": row[0],
-                "domain": f.decrypt(row[1]).decode("utf-8"),
-                "title":  f.decrypt(row[2]).decode("utf-8"),
-                "url":    f.decrypt(row[3]).decode("utf-8"),
-                "tags":   f.decrypt(row[4]).decode("utf-8") if row[4] else "",
-                "group":  f.decrypt(row[5]).decode("utf-8") if row[5] else "",
-            }
-        except Exception:
-            return None
+    row = get_db().execute(_SQL_FIND_BY_HASH, (url_hash,)).fetchone()
+    if not row:
+        return None
+    if _CACHE.f is f and row[0] in _CACHE.records:
+        return _CACHE.records[row[0]]
+    return _decrypt_row(row, f)
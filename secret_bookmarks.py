@@ -1,12 +1,13 @@
 
-import sys
-from PySide6.QtWidgets import QApplication
-from PySide6.QtGui import QFont
-from gui import MainWindow
+import sys, multiprocessing
 from config import UI_FONT_FAMILY
 
 
 def main():
+    # GUI は main() 内で読み込む（並列復号のワーカープロセスに PySide6 を読ませないため）
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtGui import QFont
+    from gui import MainWindow
     app = QApplication(sys.argv)
     app.setFont(QFont(UI_FONT_FAMILY, 10))
     w = MainWindow()
@@ -14,4 +15,5 @@ def main():
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # PyInstaller(--onefile) でワーカープロセスを使うために必要
     main()
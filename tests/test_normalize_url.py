@@ -0,0 +1,71 @@
+"""
+normalize_url の速い経路（utils._normalize_url / キャッシュ / 一括）が、旧実装（urlparse + parse_qsl + urlencode）と
+同じ結果になることを、コーパスとランダムに組み合わせたURLで確かめる。
+  python -m pytest -q tests
+"""
+import os, sys, random
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT); sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import utils
+from utils import normalize_url, normalize_urls
+from bench_normalize_url import reference_normalize_url, CORPUS, _fuzz
+
+_SCHEMES = ["http", "https", "HTTP", "hTtPs", "ftp", "mailto", ""]
+_HOSTS = ["example.com", "EXAMPLE.com", "sub.example.co.jp", "127.0.0.1", "[::1]", "[2001:db8::A]",
+          "user@h.com", "u:p@H.com", "例え.テスト", "xn--r8jz45g.jp", "h.com.", ""]
+_PORTS = ["", ":", ":80", ":443", ":8080", ":0", ":65535", ":65536", ":-1", ":x", ":080"]
+_SEGMENTS = ["a", "B", "", "%7e", "%2F", "c;d", ";p=1", "日本", "x y", ".", "..", "a+b", "~u", "@", ":"]
+_KEYS = ["a", "b", "Z", "utm_source", "UTM_MEDIUM", "utm_campaign", "fbclid", "gclid", "", "q", "%20", "a b", "é", "k=v"]
+_VALUES = ["1", "", "x y", "%2B", "+", "日本", "=", "a=b", "%", "%zz", "&"]
+
+def _random_url(rnd: random.Random) -> str:
+    url = rnd.choice(["", " ", "\t"])
+    scheme = rnd.choice(_SCHEMES)
+    url += f"{scheme}:" + rnd.choice(["//", "//", "/", ""])
+    url += rnd.choice(_HOSTS) + rnd.choice(_PORTS)
+    url += "".join("/" * rnd.randint(1, 3) + rnd.choice(_SEGMENTS) for _ in range(rnd.randint(0, 4)))
+    if rnd.random() < 0.7:
+        sep = rnd.choice(["&", "&", ";", "&&"])
+        url += "?" + sep.join(
+            rnd.choice([f"{rnd.choice(_KEYS)}={rnd.choice(_VALUES)}", rnd.choice(_KEYS)])
+            for _ in range(rnd.randint(0, 6)))
+    if rnd.random() < 0.3:
+        url += "#" + rnd.choice(_SEGMENTS)
+    return url + rnd.choice(["", "", " "])
+
+def _urls(seed: int, n: int = 5000) -> list[str]:
+    rnd = random.Random(seed)
+    return [_random_url(rnd) for _ in range(n)]
+
+@pytest.mark.parametrize("url", CORPUS)
+def test_corpus_matches_reference(url):
+    assert utils._normalize_url(url) == reference_normalize_url(url)
+    assert normalize_url(url) == reference_normalize_url(url)
+
+@pytest.mark.parametrize("seed", range(8))
+def test_generated_urls_match_reference(seed):
+    for url in _urls(seed):
+        assert utils._normalize_url(url) == reference_normalize_url(url), url
+
+def test_bench_fuzz_matches_reference():
+    for url in _fuzz(20_000, seed=7):
+        assert utils._normalize_url(url) == reference_normalize_url(url), url
+
+def test_cached_and_batch_paths_agree():
+    urls = _urls(100, 2000)
+    urls += urls[:500]  # 重複（キャッシュ・一括の重複除去を通す）
+    utils._normalize_url_cached.cache_clear()
+    want = [reference_normalize_url(u) for u in urls]
+    assert [normalize_url(u) for u in urls] == want
+    assert [normalize_url(u) for u in urls] == want  # 2回目はキャッシュから
+    assert normalize_urls(urls) == want
+    assert normalize_urls([]) == []
+
+def test_normalization_is_idempotent():
+    for url in _urls(200, 2000) + CORPUS:
+        once = normalize_url(url)
+        if once != url:
+            assert normalize_url(once) == reference_normalize_url(once)
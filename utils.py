@@ -1,6 +1,7 @@
 
 import os, re, json
-from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from functools import lru_cache
+from urllib.parse import urlparse, urlsplit, parse_qsl, urlencode
 
 # ---- リソースパス
 def resource_path(name: str) -> str:
@@ -8,8 +9,10 @@ def resource_path(name: str) -> str:
     return os.path.join(base, name) if base else os.path.abspath(name)
 
 # ---- URL判定
+_URL_HEAD = re.compile(r"^https?://")
+
 def is_url(text: str) -> bool:
-    return bool(re.match(r"^https?://", text or ""))
+    return bool(_URL_HEAD.match(text or ""))
 
 # ---- ドメイン抽出
 def extract_domain(url: str) -> str:
@@ -24,6 +27,60 @@ _TRACKING_KEYS = {
     "utm_name","utm_id","utm_reader","utm_viz_id","utm_pubreferrer",
     "fbclid","gclid","igshid","mc_cid","mc_eid"
 }
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_MULTI_SLASH = re.compile(r"//+")
+# エスケープ不要な文字だけのクエリ（parse_qsl で戻しても urlencode で付け直しても変わらない）
+# 値の中に "=" があるもの（a=b=c → b%3Dc）は通さない
+_PLAIN_QUERY = re.compile(r"(?:[A-Za-z0-9_.~-]+=[A-Za-z0-9_.~-]*(?=&|$)|&)*")
+_NORMALIZE_CACHE_SIZE = 4096  # 同じURLを何度も正規化する（クリップボード・重複確認・url_hash）ための LRU
+
+def _normalize_url(url: str) -> str:
+    # urlparse / urlunparse と同じ結果になるように、必要なところだけ自前で行う（bench_normalize_url.py で旧実装と照合）
+    try:
+        p = urlsplit(url.strip())
+        scheme = p.scheme.lower()
+        if scheme not in _DEFAULT_PORTS:
+            return url  # 非HTTP(S)は触らない
+        netloc = p.netloc
+        if "@" in netloc or "[" in netloc or ":" in netloc:
+            host = p.hostname
+            netloc = host.lower() if host else ""
+            port = p.port
+            if port and port != _DEFAULT_PORTS[scheme]:
+                netloc = f"{netloc}:{port}"
+        else:
+            netloc = netloc.lower()  # ユーザー情報・ポート・IPv6 の無いホストはそのまま
+        path = p.path
+        if ";" in path:
+            # urlparse と同じく、最後のセグメントの ;params は捨てる
+            i = path.find(";", max(path.rfind("/"), 0))
+            if i >= 0:
+                path = path[:i]
+        path = path or "/"
+        if "//" in path:
+            path = _MULTI_SLASH.sub("/", path)
+        if path != "/" and path.endswith("/"):
+            path = path[:-1]
+        if path[0] != "/":
+            path = "/" + path
+        # フラグメント除去。クエリが無ければ分解・組み立てを省く
+        if not p.query:
+            return f"{scheme}://{netloc}{path}"
+        # 空値は落とす。キーで昇順、同キーは値で安定ソート
+        if _PLAIN_QUERY.fullmatch(p.query):
+            params = sorted(kv for kv in (pair.split("=", 1) for pair in p.query.split("&") if pair)
+                            if kv[1] and kv[0].lower() not in _TRACKING_KEYS)
+            query = "&".join(f"{k}={v}" for k, v in params)
+        else:
+            params = sorted((k, v) for k, v in parse_qsl(p.query) if k and k.lower() not in _TRACKING_KEYS)
+            query = urlencode(params, doseq=True)
+        return f"{scheme}://{netloc}{path}?{query}" if query else f"{scheme}://{netloc}{path}"
+    except Exception:
+        return url
+
+@lru_cache(maxsize=_NORMALIZE_CACHE_SIZE)
+def _normalize_url_cached(url: str) -> str:
+    return _normalize_url(url)
 
 def normalize_url(url: str) -> str:
     """
@@ -33,38 +90,25 @@ def normalize_url(url: str) -> str:
       - 末尾スラ削除（ただしルートは'/'のまま）
       - フラグメント(#...)除去
       - トラッキング系クエリ削除 + クエリキーで昇順ソート + 空値削除
+    結果は元の文字列をキーに LRU キャッシュする。
     """
-    try:
-        p = urlparse(url.strip())
-        if p.scheme.lower() not in ("http", "https"):
-            return url  # 非HTTP(S)は触らない
-        scheme = p.scheme.lower()
-        netloc = p.hostname.lower() if p.hostname else ""
-        port = p.port
-        if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
-            netloc = f"{netloc}:{port}"
-        path = p.path or "/"
-        path = re.sub(r"//+", "/", path)
-        if path != "/" and path.endswith("/"):
-            path = path[:-1]
-        # クエリ処理
-        params = []
-        for k, v in parse_qsl(p.query, keep_blank_values=False):
-            if not k: 
-                continue
-            if k.lower() in _TRACKING_KEYS:
-                continue
-            if v is None or v == "":
-                continue
-            params.append((k, v))
-        # キーで昇順、同キーは値で安定ソート
-        params.sort(key=lambda kv: (kv[0], kv[1]))
-        query = urlencode(params, doseq=True)
-        # フラグメント除去
-        fragment = ""
-        return urlunparse((scheme, netloc, path, "", query, fragment))
-    except Exception:
-        return url
+    if not isinstance(url, str):
+        return _normalize_url(url)
+    return _normalize_url_cached(url)
+
+def normalize_urls(urls) -> list[str]:
+    """
+    まとめて正規化する（取り込み・移行用。結果は入力順）。
+    同じ文字列は1回だけ計算し、単発用の LRU キャッシュは使わない（大量の一度きりのURLで追い出さないため）。
+    """
+    done = {}
+    out = []
+    for url in urls:
+        n = done.get(url)
+        if n is None:
+            n = done[url] = _normalize_url(url)
+        out.append(n)
+    return out
 
 # ---- 設定ファイル（JSON）: ~/.config/SecretBookMarks/SecretBookMarks_settings.json
 def app_config_dir() -> str:
@@ -75,8 +119,8 @@ def app_config_dir() -> str:
 def settings_file_path() -> str:
     return os.path.join(app_config_dir(), "SecretBookMarks_settings.json")
 
-def load_settings_json() -> dict:
-    path = settings_file_path()
+def load_settings_json(path: str | None = None) -> dict:
+    path = path or settings_file_path()
     try:
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
@@ -85,10 +129,62 @@ def load_settings_json() -> dict:
         pass
     return {}
 
-def save_settings_json(data: dict) -> None:
-    path = settings_file_path()
+def save_settings_json(data: dict, path: str | None = None) -> None:
+    """一時ファイルに書いてから置き換える（途中で落ちても元のファイルは壊れない）。"""
+    path = path or settings_file_path()
+    tmp = path + ".tmp"
     try:
-        with open(path, "w", encoding="utf-8") as f:
+        with open(tmp, "w", encoding="utf-8") as f:
             json.dump(data or {}, f, ensure_ascii=False, indent=2)
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, path)
     except Exception:
-        pass
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+class SettingsStore:
+    """
+    設定を1回だけ読み、以後の get はメモリから返す。
+      - set は値を書き換えて印を付け、on_change を呼ぶだけ（GUI はここでデバウンス用のタイマーを始める）
+      - flush で変更があったときだけ save_settings_json で書く
+    """
+    def __init__(self, path: str | None = None, *, on_change=None):
+        self.path = path
+        self.on_change = on_change
+        self._data: dict | None = None
+        self._dirty = False
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = load_settings_json(self.path)
+        return self._data
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key: str, value):
+        if key in self.data and self.data[key] == value:
+            return
+        self.data[key] = value
+        self._dirty = True
+        if self.on_change:
+            self.on_change()
+
+    def flush(self) -> bool:
+        """未保存の変更があれば書く。書いたら True。"""
+        if not self._dirty:
+            return False
+        save_settings_json(self.data, self.path)
+        self._dirty = False
+        return True
+
+_SETTINGS: SettingsStore | None = None
+
+def get_settings() -> SettingsStore:
+    global _SETTINGS
+    if _SETTINGS is None:
+        _SETTINGS = SettingsStore()
+    return _SETTINGS